@@ -0,0 +1,141 @@
+import os
+import re
+import json
+import gzip
+import hashlib
+
+try:
+    import rjsmin   # optional: without it assets are fingerprinted but not minified
+except ImportError:
+    rjsmin = None
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Paths
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_NAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+HISTORY_NAME = 'history.json'
+# Fingerprints of this many builds stay on disk, so pages cached by browsers
+# (or rendered just before a deploy) can still load the assets they reference.
+KEEP_BUILDS = 3
+
+# Source assets, relative to static/. Each becomes static/dist/<stem>.<hash><ext>
+# plus .gz / .br siblings.
+ASSETS = ['js/app.js', 'css/style.css']
+
+# {{ asset_url('css/style.css') }} in templates; the static builders resolve it too
+ASSET_TAG_RE = re.compile(r"""\{\{\s*asset_url\(\s*['"]([^'"]+)['"]\s*\)\s*\}\}""")
+
+
+def minify(rel_path, text):
+    if rel_path.endswith('.js') and rjsmin:
+        return rjsmin.jsmin(text)
+    if rel_path.endswith('.css') and rcssmin:
+        return rcssmin.cssmin(text)
+    return text
+
+
+def _write(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)   # atomic: several gunicorn workers may build at once
+
+
+def load_manifest(static_dir=STATIC_DIR):
+    """{source path: {'file': 'dist/...', 'source': sha256}} or {} if never built."""
+    try:
+        with open(os.path.join(static_dir, DIST_NAME, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _load_history(dist_dir):
+    """Fingerprinted file names of recent builds, newest first."""
+    try:
+        with open(os.path.join(dist_dir, HISTORY_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _source_hash(static_dir, rel_path):
+    with open(os.path.join(static_dir, rel_path), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def manifest_is_current(manifest, static_dir=STATIC_DIR):
+    """True when every asset was built from the source currently on disk."""
+    dist_dir = os.path.join(static_dir, DIST_NAME)
+    for rel_path in ASSETS:
+        entry = manifest.get(rel_path)
+        if not entry or not os.path.exists(os.path.join(static_dir, entry['file'])):
+            return False
+        if entry.get('source') != _source_hash(static_dir, rel_path):
+            return False
+    return os.path.isdir(dist_dir)
+
+
+def build_assets(static_dir=STATIC_DIR, verbose=True):
+    """Minify, fingerprint and precompress ASSETS. Returns the new manifest."""
+    dist_dir = os.path.join(static_dir, DIST_NAME)
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest = {}
+    for rel_path in ASSETS:
+        with open(os.path.join(static_dir, rel_path), 'rb') as f:
+            source = f.read()
+        out = minify(rel_path, source.decode('utf-8')).encode('utf-8')
+        stem, ext = os.path.splitext(os.path.basename(rel_path))
+        name = f'{stem}.{hashlib.sha256(out).hexdigest()[:12]}{ext}'
+        path = os.path.join(dist_dir, name)
+        if not os.path.exists(path):
+            _write(f'{path}.gz', gzip.compress(out, compresslevel=9))
+            if brotli:
+                _write(f'{path}.br', brotli.compress(out, quality=11))
+            _write(path, out)   # last, so a present file implies its siblings are too
+        manifest[rel_path] = {'file': f'{DIST_NAME}/{name}', 'source': hashlib.sha256(source).hexdigest()}
+        if verbose:
+            print(f'  {rel_path}: {len(source):,} -> {len(out):,} bytes -> {DIST_NAME}/{name}')
+
+    _write(os.path.join(dist_dir, MANIFEST_NAME), json.dumps(manifest, indent=2).encode('utf-8'))
+
+    # Drop fingerprints not referenced by any of the last KEEP_BUILDS builds
+    current = sorted(os.path.basename(e['file']) for e in manifest.values())
+    history = [current] + [names for names in _load_history(dist_dir) if names != current]
+    history = history[:KEEP_BUILDS]
+    _write(os.path.join(dist_dir, HISTORY_NAME), json.dumps(history).encode('utf-8'))
+    keep = {name for names in history for name in names}
+    for entry in os.scandir(dist_dir):
+        base = re.sub(r'\.(gz|br)$', '', entry.name)
+        if entry.name not in (MANIFEST_NAME, HISTORY_NAME) and base not in keep and not entry.name.endswith('.tmp'):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+    return manifest
+
+
+def resolve_asset_tags(html, url_for_asset):
+    """Replace {{ asset_url('...') }} tags using url_for_asset(source path)."""
+    return ASSET_TAG_RE.sub(lambda m: url_for_asset(m.group(1)), html)
+
+
+def main():
+    print("Building static assets...")
+    if not (rjsmin and rcssmin):
+        print("⚠️ Warning: rjsmin/rcssmin not installed — assets will not be minified.")
+    build_assets()
+    print("✅ Assets built.")
+
+
+if __name__ == "__main__":
+    main()
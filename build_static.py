@@ -1,86 +1,34 @@
 import os
+import re
 import json
+import time
 import shutil
-import urllib.request
-import re
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
-def build_static_project():
-    src_dir = "/home/venkadesan.k/Documents/Personalcode"
-    dest_dir = "/home/venkadesan.k/Documents/Personalcode1"
-
-    print(f"Building static project from {src_dir} to {dest_dir}...")
-
-    # Create destination directories
-    os.makedirs(dest_dir, exist_ok=True)
-    os.makedirs(os.path.join(dest_dir, 'static'), exist_ok=True)
-    os.makedirs(os.path.join(dest_dir, 'blog'), exist_ok=True)
-
-    # 1. Fetch live data and save to prompts.json
-    print("Fetching live prompt data...")
-    latest_data = {"prompts": [], "analytics": [], "comments": []}
-    try:
-        req = urllib.request.Request("https://video-prompts-gallery.onrender.com/api/v1/prompts")
-        with urllib.request.urlopen(req) as response:
-            if response.status == 200:
-                latest_data = json.loads(response.read().decode('utf-8'))
-                latest_data['analytics'] = [a for a in latest_data.get('analytics', []) if a.get('Event Type') == 'like']
-    except Exception as e:
-        print(f"Warning: Could not fetch live data: {e}")
-
-    with open(os.path.join(dest_dir, 'prompts.json'), 'w') as f:
-        json.dump(latest_data, f)
-    
-    # 2. Copy static files
-    print("Copying static files...")
-    if os.path.exists(os.path.join(dest_dir, 'static')):
-        shutil.rmtree(os.path.join(dest_dir, 'static'))
-    shutil.copytree(os.path.join(src_dir, 'static'), os.path.join(dest_dir, 'static'))
-
-    # 3. Process and Copy HTML files
-    print("Converting HTML files...")
-    templates = os.listdir(os.path.join(src_dir, 'templates'))
-    for t in templates:
-        if not t.endswith('.html'):
-            continue
-        
-        with open(os.path.join(src_dir, 'templates', t), 'r') as f:
-            html = f.read()
-
-        # Fix paths for static hosting
-        html = html.replace('href="/static/', 'href="./static/')
-        html = html.replace('src="/static/', 'src="./static/')
-        
-        # Determine output path (blog goes into /blog folder)
-        if t.startswith('blog_'):
-            blog_name = t.replace('blog_', '').replace('.html', '')
-            out_path = os.path.join(dest_dir, 'blog', f"{blog_name}.html")
-            
-            # Additional path fix for nested blog files
-            html = html.replace('href="./static/', 'href="../static/')
-            html = html.replace('src="./static/', 'src="../static/')
-            html = html.replace('href="/blog"', 'href="../blog.html"')
-            html = html.replace('href="/"', 'href="../index.html"')
-        else:
-            if t == 'blog_index.html':
-                 out_path = os.path.join(dest_dir, 'blog.html')
-            else:
-                 out_path = os.path.join(dest_dir, t)
-            
-            html = html.replace('href="/blog"', 'href="./blog.html"')
-            html = html.replace('href="/about"', 'href="./about.html"')
-            html = html.replace('href="/contact"', 'href="./contact.html"')
-            html = html.replace('href="/"', 'href="./index.html"')
-
-        with open(out_path, 'w') as f:
-            f.write(html)
-
-    # 4. Modify app.js for static JSON fetching
-    print("Modifying app.js for static architecture...")
-    app_js_path = os.path.join(dest_dir, 'static', 'js', 'app.js')
-    with open(app_js_path, 'r') as f:
-        app_js = f.read()
-
-    js_overrides = """
+import compact_data
+import snapshot_sync
+from build_assets import resolve_asset_tags
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LIVE_URL = "https://video-prompts-gallery.onrender.com"
+# Builder state lives outside the output directory so it is never deployed;
+# each output directory gets its own subdirectory of the cache.
+CACHE_DIR = os.path.join(BASE_DIR, '.build-cache')
+MANIFEST_NAME = 'build-manifest.json'
+# Local copy of the server's export stream, updated incrementally (snapshot_sync.py)
+DATA_STORE_NAME = 'export-cache.sqlite'
+# State files older builds wrote into the output directory
+LEGACY_STATE_FILES = ('.build-manifest.json', '.export-cache.sqlite')
+
+# Rendered by Flask only (Jinja logic, no static equivalent)
+SERVER_ONLY_TEMPLATES = {'prompt.html'}
+# Fingerprinted bundles are a server concern; the static mirror uses raw files
+SKIP_STATIC_DIRS = {'dist'}
+
+# prompts.json is in the compact columnar format (see compact_data.py)
+JS_OVERRIDES = compact_data.DECODER_JS + """
 // --- STATIC SITE OVERRIDES ---
 async function fetchData() {
     try {
@@ -88,11 +36,11 @@ async function fetchData() {
         if (loader) loader.style.display = 'none';
 
         const response = await fetch('./prompts.json');
-        const data = await response.json();
-        
+        const data = decodeCompactPrompts(await response.json());
+
         appState.prompts = data.prompts || [];
-        appState.analytics = data.analytics || [];
-        appState.comments = data.comments || [];
+        appState.counts = data.counts || {};
+        appState.images = data.images || {};
 
         renderFilters();
         renderGrid();
@@ -105,32 +53,244 @@ async function logVisit(id) { return; }
 async function checkAuthStatus() { return; }
 async function checkAdminSession() { return; }
 """
-    app_js += f"\n{js_overrides}\n"
-    
-    # Hide login features via CSS inject
-    css_hide_login = """
+
+# Hide login features via CSS inject
+CSS_HIDE_LOGIN = """
 \n/* Static Site Mode: Hide all Admin/Login features */
-.vpg-nav-link[onclick*="openAuthModal"], 
+.vpg-nav-link[onclick*="openAuthModal"],
 .vpg-nav-link[onclick*="userLogout"],
 .footer-link-btn[onclick*="openAdminLogin"],
 .footer-link-btn[onclick*="openAuthModal"],
-#vpg-user-badge, #vpg-admin-bar, 
+#vpg-user-badge, #vpg-admin-bar,
 #vpg-admin-login-modal, #vpg-auth-modal, #vpg-prompt-editor,
-[ondblclick*="openAdminLogin"] { 
-    display: none !important; 
+[ondblclick*="openAdminLogin"] {
+    display: none !important;
 }
 """
-    style_css_path = os.path.join(dest_dir, 'static', 'css', 'style.css')
-    with open(style_css_path, 'a') as f:
-        f.write(css_hide_login)
 
-    # Disable preloader auto-init
-    app_js = app_js.replace('initPreloader();', '// initPreloader();')
+# Every server-absolute link the templates use, rewritten in one regex pass
+URL_RE = re.compile(r'(?P<attr>href|src)="(?P<url>/static/[^"]*|/blog|/about|/contact|/)"')
+EMPTY_DATA = compact_data.dumps({"prompts": [], "counts": {}, "images": {}}).encode('utf-8')
+PAGE_TARGETS = {'/blog': 'blog.html', '/about': 'about.html', '/contact': 'contact.html', '/': 'index.html'}
+
+# Outputs cached by a build with a different recipe are all redone
+RECIPE = hashlib.sha256((JS_OVERRIDES + CSS_HIDE_LOGIN + URL_RE.pattern).encode()).hexdigest()
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def rewrite_urls(html, prefix):
+    """Point server-absolute links at the static mirror (prefix './' or '../')."""
+    def repl(m):
+        url = m.group('url')
+        target = prefix + url[1:] if url.startswith('/static/') else prefix + PAGE_TARGETS[url]
+        return f'{m.group("attr")}="{target}"'
+    return URL_RE.sub(repl, html)
+
+
+def output_path_for(template_name):
+    """Output path, relative to dest, for a template (blog posts go into /blog)."""
+    if template_name.startswith('blog_'):
+        return os.path.join('blog', template_name[len('blog_'):])
+    return template_name
+
+
+def state_dir_for(dest_dir):
+    """Cache subdirectory holding the manifest and data store for one output directory."""
+    return os.path.join(CACHE_DIR, hashlib.sha256(os.path.abspath(dest_dir).encode()).hexdigest()[:12])
+
+
+def render_template_file(args):
+    """Process-pool worker: (template path, output rel path) -> (output rel path, bytes)."""
+    src_path, out_rel = args
+    with open(src_path, encoding='utf-8') as f:
+        html = f.read()
+    # Asset tags are resolved by Flask at render time; use the raw files here
+    html = resolve_asset_tags(html, lambda rel: f'/static/{rel}')
+    prefix = '../' if os.path.dirname(out_rel) else './'
+    return out_rel, rewrite_urls(html, prefix).encode('utf-8')
+
+
+class Builder:
+    def __init__(self, src_dir, dest_dir, api_url, workers, fetch=True, state_dir=None):
+        self.src_dir = src_dir
+        self.dest_dir = dest_dir
+        self.api_url = api_url
+        self.workers = workers
+        self.fetch = fetch
+        self.state_dir = state_dir or state_dir_for(dest_dir)
+        self.manifest_path = os.path.join(self.state_dir, MANIFEST_NAME)
+        self.old = self._load_manifest()
+        self.new = {'outputs': {}}
+        self.written = 0
+        self.timings = []
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            return manifest if manifest.get('recipe') == RECIPE else {}
+        except (OSError, ValueError):
+            return {}
+
+    def stage(self, name, fn):
+        started = time.perf_counter()
+        fn()
+        self.timings.append((name, time.perf_counter() - started))
+
+    def unchanged(self, out_rel, source_key):
+        """True when out_rel was built from source_key and is still on disk."""
+        entry = self.old.get('outputs', {}).get(out_rel)
+        if entry and entry['source'] == source_key and os.path.exists(os.path.join(self.dest_dir, out_rel)):
+            self.new['outputs'][out_rel] = entry
+            return True
+        return False
+
+    def write(self, out_rel, data, source_key, **extra):
+        """Write out_rel unless its current content already matches."""
+        path = os.path.join(self.dest_dir, out_rel)
+        digest = sha256(data)
+        entry = self.old.get('outputs', {}).get(out_rel)
+        if not (entry and entry.get('output') == digest and os.path.exists(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self.written += 1
+        self.new['outputs'][out_rel] = dict(extra, source=source_key, output=digest)
+
+    # ── Stages ─────────────────────────────────────────────────
+    def fetch_data(self):
+        out_rel = 'prompts.json'
+        store = os.path.join(self.state_dir, DATA_STORE_NAME)
+        if self.fetch:
+            # Only items changed since the last build are downloaded
+            try:
+                cursor, applied = snapshot_sync.sync(self.api_url, store)
+                print(f"  data: {applied} change(s), cursor {cursor[:12]}")
+            except Exception as e:
+                print(f"Warning: Could not fetch live data: {e}")
+        # prompts.json is rebuilt only when the synced data moved to a new cursor
+        cursor = snapshot_sync.stored_cursor(store)
+        previous = self.old.get('outputs', {}).get(out_rel)
+        if cursor:
+            if not self.unchanged(out_rel, cursor):
+                payload = snapshot_sync.load_payload(store)
+                self.write(out_rel, compact_data.dumps(payload).encode('utf-8'), cursor)
+        elif previous and os.path.exists(os.path.join(self.dest_dir, out_rel)):
+            self.new['outputs'][out_rel] = previous
+        else:
+            self.write(out_rel, EMPTY_DATA, 'empty')
+
+    def copy_static(self):
+        static_src = os.path.join(self.src_dir, 'static')
+        derived = {
+            # Static data source; preloader auto-init disabled
+            os.path.join('js', 'app.js'): lambda data: (data + f"\n{JS_OVERRIDES}\n".encode('utf-8'))
+                                                       .replace(b'initPreloader();', b'// initPreloader();'),
+            os.path.join('css', 'style.css'): lambda data: data + CSS_HIDE_LOGIN.encode('utf-8'),
+        }
+        for root, dirs, files in os.walk(static_src):
+            dirs[:] = [d for d in dirs if not (root == static_src and d in SKIP_STATIC_DIRS)]
+            for name in files:
+                src_path = os.path.join(root, name)
+                rel = os.path.relpath(src_path, static_src)
+                out_rel = os.path.join('static', rel)
+                st = os.stat(src_path)
+                stat_key = f'{st.st_size}:{st.st_mtime_ns}'
+                entry = self.old.get('outputs', {}).get(out_rel)
+                # Same size and mtime as last build: skip without even reading it
+                if entry and entry.get('stat') == stat_key and os.path.exists(os.path.join(self.dest_dir, out_rel)):
+                    self.new['outputs'][out_rel] = entry
+                    continue
+                with open(src_path, 'rb') as f:
+                    data = f.read()
+                source_key = sha256(data)
+                if self.unchanged(out_rel, source_key):
+                    self.new['outputs'][out_rel]['stat'] = stat_key
+                    continue
+                if rel in derived:
+                    data = derived[rel](data)
+                self.write(out_rel, data, source_key, stat=stat_key)
+
+    def render_templates(self):
+        templates_dir = os.path.join(self.src_dir, 'templates')
+        jobs, keys = [], {}
+        for name in sorted(os.listdir(templates_dir)):
+            if not name.endswith('.html') or name in SERVER_ONLY_TEMPLATES:
+                continue
+            src_path = os.path.join(templates_dir, name)
+            out_rel = output_path_for(name)
+            with open(src_path, 'rb') as f:
+                source_key = sha256(f.read())
+            if not self.unchanged(out_rel, source_key):
+                jobs.append((src_path, out_rel))
+                keys[out_rel] = source_key
+        if not jobs:
+            return
+        if self.workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as pool:
+                results = list(pool.map(render_template_file, jobs))
+        else:
+            results = [render_template_file(job) for job in jobs]
+        for out_rel, data in results:
+            self.write(out_rel, data, keys[out_rel])
+
+    def prune(self):
+        """Delete outputs from the previous build that this build didn't produce."""
+        for out_rel in set(self.old.get('outputs', {})) - set(self.new['outputs']):
+            try:
+                os.remove(os.path.join(self.dest_dir, out_rel))
+            except OSError:
+                pass
+        self.new['recipe'] = RECIPE
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.new, f, indent=1, sort_keys=True)
+
+    def run(self):
+        os.makedirs(self.dest_dir, exist_ok=True)
+        os.makedirs(self.state_dir, exist_ok=True)
+        for name in LEGACY_STATE_FILES:
+            try:
+                os.remove(os.path.join(self.dest_dir, name))
+            except OSError:
+                pass
+        started = time.perf_counter()
+        self.stage('fetch data', self.fetch_data)
+        self.stage('static files', self.copy_static)
+        self.stage('templates', self.render_templates)
+        self.stage('prune + manifest', self.prune)
+        for name, seconds in self.timings:
+            print(f"  {name:<18}{seconds * 1000:8.1f} ms")
+        print(f"✅ Static frontend built in {(time.perf_counter() - started) * 1000:.0f} ms "
+              f"({self.written} file(s) written) -> {self.dest_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the static mirror of the gallery.')
+    parser.add_argument('--src', default=os.getenv('STATIC_BUILD_SRC', BASE_DIR),
+                        help='project directory containing templates/ and static/')
+    parser.add_argument('--dest', default=os.getenv('STATIC_BUILD_DEST', os.path.join(BASE_DIR, 'static_site')),
+                        help='output directory')
+    parser.add_argument('--api-url', default=LIVE_URL, help='server to fetch prompt data from')
+    parser.add_argument('--no-fetch', action='store_true', help='skip fetching live prompt data')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='template worker processes (1 = in-process)')
+    parser.add_argument('--clean', action='store_true', help='delete the output directory first')
+    args = parser.parse_args()
 
-    with open(app_js_path, 'w') as f:
-        f.write(app_js)
+    dest_dir = os.path.abspath(args.dest)
+    if args.clean:
+        for path in (dest_dir, state_dir_for(dest_dir)):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+    print(f"Building static project from {args.src} to {dest_dir}...")
+    Builder(os.path.abspath(args.src), dest_dir, args.api_url.rstrip('/'), args.workers,
+            fetch=not args.no_fetch).run()
 
-    print("✅ Static frontend generated successfully.")
 
 if __name__ == "__main__":
-    build_static_project()
+    main()
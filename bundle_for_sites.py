@@ -1,8 +1,10 @@
 
 import os
 import re
-import json
-import urllib.request
+
+import compact_data
+import snapshot_sync
+from build_assets import ASSET_TAG_RE
 
 # Paths
 BASE_DIR = os.getcwd()
@@ -10,6 +12,7 @@ INDEX_HTML = os.path.join(BASE_DIR, 'templates', 'index.html')
 STYLE_CSS = os.path.join(BASE_DIR, 'static', 'css', 'style.css')
 APP_JS = os.path.join(BASE_DIR, 'static', 'js', 'app.js')
 OUTPUT_FILE = os.path.join(BASE_DIR, 'dist', 'sites_google_embed.html')
+DATA_STORE = os.path.join(BASE_DIR, '.build-cache', 'sites-export-cache.sqlite')
 LIVE_URL = "https://video-prompts-gallery.onrender.com"
 
 def main():
@@ -27,15 +30,17 @@ def main():
         js = f.read()
 
     # --- LIVE DATA FETCHING ---
-    latest_data = {"prompts": [], "analytics": [], "comments": []}
+    # Synced incrementally into a local store next to the output (snapshot_sync.py)
+    latest_data = {"prompts": [], "counts": {}, "images": {}}
+    os.makedirs(os.path.dirname(DATA_STORE), exist_ok=True)
     try:
-        with urllib.request.urlopen(f"{LIVE_URL}/api/v1/prompts") as response:
-            if response.status == 200:
-                latest_data = json.loads(response.read().decode())
-                latest_data['analytics'] = [a for a in latest_data.get('analytics', []) if a.get('Event Type') == 'like']
-                print(f"✅ Fetched {len(latest_data.get('prompts', []))} prompts.")
+        cursor, applied = snapshot_sync.sync(LIVE_URL, DATA_STORE)
+        print(f"✅ Synced live data ({applied} change(s)).")
     except Exception as e:
         print(f"⚠️ Warning: Could not fetch live data: {e}")
+    if snapshot_sync.stored_cursor(DATA_STORE):
+        latest_data = snapshot_sync.load_payload(DATA_STORE)
+        print(f"✅ Bundling {len(latest_data['prompts'])} prompts.")
 
     # Remove Preloader HTML (Simple string remove)
     html = html.replace('<!-- Cinematic Preloader -->', '')
@@ -58,8 +63,7 @@ def main():
     
     # Inline CSS
     css_tag = f"<style>\n{css}\n{css_hide_login}\n</style>"
-    html = html.replace('<link rel="stylesheet" href="/static/css/style.css?v=2">', css_tag)
-    html = html.replace('<link rel="stylesheet" href="/static/css/style.css">', css_tag)
+    html = re.sub(r'<link rel="stylesheet" href="[^"]*style\.css[^"]*">', lambda m: css_tag, html, count=1)
 
     # Modify JS to handle static data ONLY
     js_inject_logic = """
@@ -70,8 +74,8 @@ async function fetchData() {
 
     if (window.STATIC_PROMPTS_DATA) {
         appState.prompts = window.STATIC_PROMPTS_DATA.prompts || [];
-        appState.analytics = window.STATIC_PROMPTS_DATA.analytics || [];
-        appState.comments = window.STATIC_PROMPTS_DATA.comments || [];
+        appState.counts = window.STATIC_PROMPTS_DATA.counts || {};
+        appState.images = window.STATIC_PROMPTS_DATA.images || {};
         renderFilters(); renderGrid(); handleRouting();
     }
 }
@@ -86,12 +90,15 @@ async function checkAdminSession() { return; }
 
     # Inline JS
     js_tag = f"<script>\n{js}\n</script>"
-    html = html.replace('<script src="/static/js/app.js?v=2.0"></script>', js_tag)
-    html = html.replace('<script src="/static/js/app.js"></script>', js_tag)
+    html = re.sub(r'<script src="[^"]*app\.js[^"]*"></script>', lambda m: js_tag, html, count=1)
+    # Any other asset references point at the raw files on the live server
+    html = ASSET_TAG_RE.sub(lambda m: f'/static/{m.group(1)}', html)
     
-    # Data Injection
-    json_data = json.dumps(latest_data, separators=(',', ':'))
-    injection = f"<script>window.STATIC_PROMPTS_DATA = {json_data}; window.SHARE_BASE_URL = '';</script>"
+    # Data Injection — compact columnar form, decoded once on load.
+    # '</' is escaped so prompt text can never close the script element.
+    json_data = compact_data.dumps(latest_data).replace('</', '<\\/')
+    injection = (f"<script>{compact_data.DECODER_JS}\n"
+                 f"window.STATIC_PROMPTS_DATA = decodeCompactPrompts({json_data}); window.SHARE_BASE_URL = '';</script>")
     html = html.replace('</head>', f"{injection}\n</head>")
     
     # Fix relative URLs
@@ -0,0 +1,110 @@
+"""Compact columnar encoding of the /api/v1/prompts payload for the static
+mirror and the Google Sites bundle.
+
+    {"v": 1, "n": rows, "cols": [column names], "data": [one list per column],
+     "dict": {column: [distinct values]},   # those columns hold indexes
+     "likes": [...], "comments": [...],     # per row, aligned with "data"
+     "img": {format: template}, "img_extra": {prompt id: renditions}}
+
+Column names appear once instead of once per row, repetitive columns like
+Category and AI Tool become small integer indexes, and the Cloudinary
+rendition URLs (derivable from each row's Image URL) are shipped as one
+template. DECODER_JS turns it back into {prompts, counts, images}.
+"""
+import json
+
+VERSION = 1
+# Dictionary-encode a column when it has at most this share of distinct values
+DICT_MAX_RATIO = 0.5
+CLOUDINARY_MARK = '/image/upload/'
+
+
+def _cloudinary_parts(url):
+    if not isinstance(url, str) or 'res.cloudinary.com/' not in url or CLOUDINARY_MARK not in url:
+        return None
+    return url.split(CLOUDINARY_MARK, 1)
+
+
+def _expand(template, url):
+    parts = _cloudinary_parts(url)
+    if not template or not parts:
+        return None
+    base, path = parts
+    return {k: v.replace('{base}', base).replace('{path}', path) for k, v in template.items()}
+
+
+def _image_template(url, renditions):
+    base, path = _cloudinary_parts(url)
+    return {k: v.replace(base, '{base}').replace(path, '{path}') for k, v in renditions.items()}
+
+
+def encode(payload):
+    """Compact form of a {prompts, counts, images} payload."""
+    prompts = payload.get('prompts') or []
+    counts = payload.get('counts') or {}
+    images = payload.get('images') or {}
+    n = len(prompts)
+
+    cols = list(dict.fromkeys(k for p in prompts for k in p))
+    data, dicts = [], {}
+    for name in cols:
+        column = [p.get(name, '') for p in prompts]
+        distinct = list(dict.fromkeys(column))
+        if n and len(distinct) <= max(1, n * DICT_MAX_RATIO):
+            index = {v: i for i, v in enumerate(distinct)}
+            dicts[name] = distinct
+            column = [index[v] for v in column]
+        data.append(column)
+
+    ids = [str(p.get('Unique ID', '')) for p in prompts]
+    likes = [counts.get(pid, {}).get('likes', 0) for pid in ids]
+    comments = [counts.get(pid, {}).get('comments', 0) for pid in ids]
+
+    # One rendition template for every Cloudinary image; rows that don't fit it
+    # (or have no renditions) are listed explicitly.
+    template = None
+    for p, pid in zip(prompts, ids):
+        if pid in images and _cloudinary_parts(p.get('Image URL')):
+            template = _image_template(p['Image URL'], images[pid])
+            break
+    img_extra = {}
+    for p, pid in zip(prompts, ids):
+        if _expand(template, p.get('Image URL')) != images.get(pid):
+            img_extra[pid] = images.get(pid)
+
+    return {'v': VERSION, 'n': n, 'cols': cols, 'data': data, 'dict': dicts,
+            'likes': likes, 'comments': comments, 'img': template, 'img_extra': img_extra}
+
+
+def dumps(payload):
+    """encode() serialised without whitespace."""
+    return json.dumps(encode(payload), separators=(',', ':'), ensure_ascii=False)
+
+
+DECODER_JS = r"""
+function decodeCompactPrompts(c) {
+    if (!c || c.v !== 1) return c || { prompts: [], counts: {}, images: {} };
+    const prompts = new Array(c.n);
+    for (let i = 0; i < c.n; i++) prompts[i] = {};
+    c.cols.forEach((name, j) => {
+        const col = c.data[j], table = c.dict[name];
+        for (let i = 0; i < c.n; i++) prompts[i][name] = table ? table[col[i]] : col[i];
+    });
+    const counts = {}, images = {};
+    const mark = '/image/upload/';
+    prompts.forEach((p, i) => {
+        const id = String(p['Unique ID'] || '');
+        if (c.likes[i] || c.comments[i]) counts[id] = { likes: c.likes[i], comments: c.comments[i] };
+        const url = p['Image URL'];
+        if (id in c.img_extra) {
+            if (c.img_extra[id]) images[id] = c.img_extra[id];
+        } else if (c.img && typeof url === 'string' && url.includes('res.cloudinary.com/') && url.includes(mark)) {
+            const at = url.indexOf(mark), base = url.slice(0, at), path = url.slice(at + mark.length);
+            const r = {};
+            for (const k in c.img) r[k] = c.img[k].split('{base}').join(base).split('{path}').join(path);
+            images[id] = r;
+        }
+    });
+    return { prompts, counts, images };
+}
+"""
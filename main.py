@@ -1,16 +1,34 @@
 import os
 import json
 import time
+import gzip
 import base64
+import csv
+import io
 import hashlib
 import secrets
 import re
+import atexit
+import mimetypes
+import queue
+import socket
+import sqlite3
+import tempfile
+import threading
+import http.client
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import wraps
+from urllib.parse import quote
+from xml.sax.saxutils import escape as xml_escape
 import pytz
 from flask import (
     Flask, render_template, jsonify, request,
-    send_from_directory, session, redirect
+    send_from_directory, session, redirect, Response, g
 )
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
@@ -19,6 +37,15 @@ from cryptography.fernet import Fernet
 import werkzeug.utils
 import cloudinary
 import cloudinary.uploader
+import build_assets
+try:
+    import brotli   # optional: only used to pre-compress API payloads
+except ImportError:
+    brotli = None
+try:
+    from PIL import Image, ImageOps   # optional: reference images pass through unprocessed
+except ImportError:
+    Image = None
 
 load_dotenv()
 
@@ -42,7 +69,7 @@ cloudinary.config(
     secure     = True
 )
 
-app = Flask(__name__)
+app = Flask(__name__, static_folder=None)   # /static is served by send_static()
 
 # ─────────────────────────────────────────────────────────────
 # CONFIG
@@ -57,6 +84,14 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'None' # Required for Google Sites ifram
 GOOGLE_SHEET_ID   = os.getenv('GOOGLE_SHEET_ID')
 GOOGLE_CREDENTIALS = os.getenv('GOOGLE_CREDENTIALS')
 
+
+def host_state_path(name):
+    """Default tempdir path for host-local state, scoped to this deployment's
+    sheet so two apps on the same host never share (or clobber) it."""
+    scope = hashlib.sha256((GOOGLE_SHEET_ID or '').encode('utf-8')).hexdigest()[:12]
+    root, ext = os.path.splitext(name)
+    return os.path.join(tempfile.gettempdir(), f'{root}_{scope}{ext}')
+
 # Admin credentials — MUST be set as 'ADMIN_PASSWORD' in Render environment variables.
 # No default is provided. If not set, admin login is permanently disabled.
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', '')
@@ -67,47 +102,296 @@ UPLOAD_FOLDER = os.path.join(app.root_path, 'static', 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# ─────────────────────────────────────────────────────────────
+# METRICS  (Prometheus text format on /api/v1/admin/metrics)
+# Counters and histograms are kept per process. Every worker also publishes
+# its series to the shared store (at most every METRICS_PUBLISH_INTERVAL), so
+# a scrape answered by any worker reports all of them under worker="<pid>".
+# ─────────────────────────────────────────────────────────────
+METRICS_TOKEN            = os.getenv('METRICS_TOKEN', '')   # scrapers send "Authorization: Bearer <token>"
+METRICS_PUBLISH_INTERVAL = 10    # seconds between a worker's shared-store updates
+METRICS_WORKER_TTL       = 600   # workers silent this long are left out of scrapes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+METRICS_HELP = {
+    'vpg_http_requests_total':            ('counter',   'HTTP responses by route, method and status.'),
+    'vpg_http_request_seconds':           ('histogram', 'Time to produce a response, by route and method.'),
+    'vpg_sheets_calls_total':             ('counter',   'Google Sheets API calls by worksheet, operation and outcome.'),
+    'vpg_sheets_call_seconds':            ('histogram', 'Google Sheets API call time by worksheet and operation.'),
+    'vpg_cache_requests_total':           ('counter',   'Cache lookups by cache and result (hit, shared, stale, miss).'),
+    'vpg_cache_age_seconds':              ('gauge',     'Seconds since the cache was last loaded.'),
+    'vpg_cache_entries':                  ('gauge',     'Items held by the cache.'),
+    'vpg_snapshot_generation':            ('gauge',     'Generation of the prompt snapshot this worker serves.'),
+    'vpg_rate_limit_rejections_total':    ('counter',   'Requests rejected by the rate limiter, by limit.'),
+    'vpg_image_provider_seconds':         ('histogram', 'Image provider call time by provider and outcome.'),
+    'vpg_image_provider_cancelled_total': ('counter',   'Provider calls abandoned because another provider won.'),
+    'vpg_image_job_seconds':              ('histogram', 'Image generation job run time by outcome.'),
+    'vpg_analytics_rows_total':           ('counter',   'Buffered Analytics rows written to the sheet or dropped, by outcome.'),
+    'vpg_analytics_queue_rows':           ('gauge',     'Analytics rows waiting for the next flush.'),
+}
+
+_metrics = {}   # (name, labels) -> number (counter) or [per-bucket counts..., sum, count] (histogram)
+_metrics_lock = threading.Lock()
+_metrics_state = {'published_at': 0}
+
+
+def _metric_key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def metric_inc(name, n=1, **labels):
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        _metrics[key] = _metrics.get(key, 0) + n
+
+
+def metric_observe(name, seconds, **labels):
+    key = _metric_key(name, labels)
+    with _metrics_lock:
+        hist = _metrics.get(key)
+        if hist is None:
+            hist = _metrics[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+                break
+        hist[-2] += seconds
+        hist[-1] += 1
+
+
+def _metric_gauges():
+    """[(name, labels, value)] read from the caches and queues at collection time."""
+    gauges = [('vpg_snapshot_generation', (), cache['generation']),
+              ('vpg_analytics_queue_rows', (), len(_analytics_queue))]
+    for outcome in ('written', 'dropped'):
+        gauges.append(('vpg_analytics_rows_total', (('outcome', outcome),), _analytics_state[outcome]))
+    age = cache_age()
+    if age is not None:
+        gauges.append(('vpg_cache_age_seconds', (('cache', 'snapshot'),), round(age, 3)))
+        gauges.append(('vpg_cache_entries', (('cache', 'snapshot'),), len(cache['prompts'] or [])))
+    if _feature_flags_cache is not None:
+        gauges.append(('vpg_cache_age_seconds', (('cache', 'feature_flags'),),
+                       round(time.time() - _feature_flags_last_load, 3)))
+        gauges.append(('vpg_cache_entries', (('cache', 'feature_flags'),), len(_feature_flags_cache)))
+    return gauges
+
+
+def _collect_metrics():
+    with _metrics_lock:
+        series = [(name, labels, list(v) if isinstance(v, list) else v) for (name, labels), v in _metrics.items()]
+    return series + _metric_gauges()
+
+
+def _publish_metrics():
+    _metrics_state['published_at'] = time.time()
+    shared_put_blob(f'metrics:{os.getpid()}', _collect_metrics())
+
+
+def _all_worker_metrics():
+    """{pid: series} for this worker (live) and every other recently published one."""
+    workers = {str(os.getpid()): _collect_metrics()}
+    cutoff = time.time() - METRICS_WORKER_TTL
+    _shared_call(lambda c: c.execute("DELETE FROM blobs WHERE name LIKE 'metrics:%' AND updated_at < ?", (cutoff,)))
+    rows = _shared_call(lambda c: c.execute("SELECT name, data FROM blobs WHERE name LIKE 'metrics:%'").fetchall(),
+                        default=[])
+    for name, data in rows:
+        pid = name.split(':', 1)[1]
+        if pid not in workers:
+            workers[pid] = [(n, tuple(map(tuple, labels)), v) for n, labels, v in json.loads(data)]
+    return workers
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    def escape(v):
+        return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels) + '}'
+
+
+def render_metrics():
+    """All workers' series in Prometheus text exposition format (0.0.4)."""
+    by_name = {}
+    for pid, series in _all_worker_metrics().items():
+        for name, labels, value in series:
+            by_name.setdefault(name, []).append((tuple(labels) + (('worker', pid),), value))
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = METRICS_HELP[name]
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for labels, value in sorted(by_name[name], key=lambda s: s[0]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            total = 0
+            for bound, n in zip(LATENCY_BUCKETS, value):
+                total += n
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", str(bound)),))} {total}')
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {value[-1]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {round(value[-2], 6)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metric_inc('vpg_http_requests_total', route=route, method=request.method, status=response.status_code)
+    if started is not None:
+        metric_observe('vpg_http_request_seconds', time.perf_counter() - started, route=route, method=request.method)
+    if time.time() - _metrics_state['published_at'] > METRICS_PUBLISH_INTERVAL:
+        _publish_metrics()
+    return response
+
+
+@app.route('/api/v1/admin/metrics')
+def admin_metrics():
+    """Prometheus scrape target. Needs the admin session or the METRICS_TOKEN bearer token."""
+    auth = request.headers.get('Authorization', '')
+    token_ok = bool(METRICS_TOKEN) and secrets.compare_digest(auth.encode(), f'Bearer {METRICS_TOKEN}'.encode())
+    if not (token_ok or session.get('admin_logged_in')):
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8',
+                    headers={'Cache-Control': 'no-store'})
+
+
 # ─────────────────────────────────────────────────────────────
 # SECURITY: DDOS/Quota Rate Limiting & HTTP Shields
 # ─────────────────────────────────────────────────────────────
-from collections import defaultdict
-import time
+# Sliding-window counters: each key keeps only (window, previous count, current
+# count), so memory per client is fixed. Idle keys are evicted LRU-style.
+# RATE_LIMIT_BACKEND=sqlite shares the counters between gunicorn workers on
+# the same host through a small local database file.
+DEFAULT_RATE_LIMIT = (60, 60)   # (requests, window seconds) per IP for /api/*
+# Per-endpoint budgets, counted separately so page-load API calls don't
+# consume the image-generation budget.
+ENDPOINT_RATE_LIMITS = {
+    '/api/v1/generate-image': (5, 60),
+}
+RATE_LIMIT_MESSAGES = {
+    '/api/v1/generate-image': 'Security Block: Too many image generation requests. Please wait a minute.',
+}
+# Content-addressed generated images are immutable and browser-cached; don't
+# charge them against the per-IP API budget.
+RATE_LIMIT_EXEMPT_PREFIX = '/api/v1/generated/'
+# Polls of a queued image job get a bucket of their own, so waiting on a slow
+# generation neither eats the page's API budget nor gets cut off by it.
+JOB_POLL_PREFIX     = '/api/v1/generate-image/'
+JOB_POLL_RATE_LIMIT = (120, 60)
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '10000'))
+RATE_LIMIT_BACKEND  = os.getenv('RATE_LIMIT_BACKEND', 'memory')   # 'memory' | 'sqlite'
+RATE_LIMIT_DB       = os.getenv('RATE_LIMIT_DB', host_state_path('vpg_ratelimit.db'))
+
+API_RATE_LIMITER = OrderedDict()   # key -> [window_index, prev_count, curr_count]
+_rate_lock  = threading.Lock()
+_rate_local = threading.local()
+_rate_state = {'hits': 0, 'sqlite_retry_at': 0}
+
+
+def _window_allows(state, limit, window, now):
+    """Advance a [window_index, prev, curr] triple to `now` and count the hit if allowed."""
+    idx = int(now // window)
+    if state[0] != idx:
+        state[1] = state[2] if state[0] == idx - 1 else 0
+        state[2] = 0
+        state[0] = idx
+    elapsed = (now % window) / window
+    if state[1] * (1 - elapsed) + state[2] >= limit:
+        return False
+    state[2] += 1
+    return True
+
+
+def _rate_allow_memory(key, limit, window, now):
+    with _rate_lock:
+        state = API_RATE_LIMITER.get(key)
+        if state is None:
+            state = API_RATE_LIMITER[key] = [int(now // window), 0, 0]
+            while len(API_RATE_LIMITER) > RATE_LIMIT_MAX_KEYS:
+                API_RATE_LIMITER.popitem(last=False)
+        else:
+            API_RATE_LIMITER.move_to_end(key)
+        return _window_allows(state, limit, window, now)
+
+
+def _rate_db():
+    conn = getattr(_rate_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(RATE_LIMIT_DB, timeout=2, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS rate_limits ('
+                     'key TEXT PRIMARY KEY, win INTEGER, prev INTEGER, curr INTEGER, touched REAL)')
+        _rate_local.conn = conn
+    return conn
+
+
+def _rate_allow_sqlite(key, limit, window, now):
+    conn = _rate_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT win, prev, curr FROM rate_limits WHERE key = ?', (key,)).fetchone()
+        state = list(row) if row else [int(now // window), 0, 0]
+        allowed = _window_allows(state, limit, window, now)
+        conn.execute('INSERT OR REPLACE INTO rate_limits (key, win, prev, curr, touched) VALUES (?, ?, ?, ?, ?)',
+                     (key, state[0], state[1], state[2], now))
+        _rate_state['hits'] += 1
+        if _rate_state['hits'] % 1000 == 0:
+            # Evict keys idle for two full windows of the longest budget
+            longest = max([DEFAULT_RATE_LIMIT[1]] + [w for _, w in ENDPOINT_RATE_LIMITS.values()])
+            conn.execute('DELETE FROM rate_limits WHERE touched < ?', (now - 2 * longest,))
+        conn.execute('COMMIT')
+        return allowed
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def rate_limit_allow(key, limit, window):
+    now = time.time()
+    if RATE_LIMIT_BACKEND == 'sqlite' and now >= _rate_state['sqlite_retry_at']:
+        try:
+            return sqlite_retry(_rate_allow_sqlite, key, limit, window, now)
+        except Exception as e:
+            # Fail over to per-process counters rather than blocking or opening up the API,
+            # but only for a while: per-process limits multiply with the worker count
+            print(f'rate limiter sqlite error, using memory backend for {SQLITE_FAILOVER_COOLDOWN}s: {e}')
+            _rate_state['sqlite_retry_at'] = now + SQLITE_FAILOVER_COOLDOWN
+            _rate_local.conn = None
+    return _rate_allow_memory(key, limit, window, now)
 
-API_RATE_LIMITER = defaultdict(list)
 
 @app.before_request
 def check_rate_limit():
     """Prevents API brute forcing, DDoS, and AI API quota draining per IP."""
-    ip = request.headers.get('X-Forwarded-For', request.remote_addr)
-    if not request.path.startswith('/api/'):
+    if not request.path.startswith('/api/') or request.path.startswith(RATE_LIMIT_EXEMPT_PREFIX):
         return
-        
-    now = time.time()
-    API_RATE_LIMITER[ip] = [t for t in API_RATE_LIMITER[ip] if now - t < 60]
-    
-    # Separate per-endpoint counter for generate-image so page-load API calls
-    # don't consume the image-generation budget.
-    gen_key = ip + '::generate-image'
-    if request.path == '/api/v1/generate-image':
-        API_RATE_LIMITER[gen_key] = [t for t in API_RATE_LIMITER[gen_key] if now - t < 60]
-        if len(API_RATE_LIMITER[gen_key]) >= 5:
-            return jsonify({
-                'status': 'error',
-                'message': 'Security Block: Too many image generation requests. Please wait a minute.'
-            }), 429
-        API_RATE_LIMITER[gen_key].append(now)
-        return  # skip the general counter for this endpoint
-
-    # General API rate limit: 60 requests/min per IP
-    limit = 60
-        
-    if len(API_RATE_LIMITER[ip]) >= limit:
-        return jsonify({
-            'status': 'error', 
-            'message': 'Security Block: Too many requests from this IP. Please slow down.'
-        }), 429
-        
-    API_RATE_LIMITER[ip].append(now)
+    ip = request.headers.get('X-Forwarded-For', request.remote_addr) or ''
+    ip = ip.split(',')[0].strip()
+
+    if request.path in ENDPOINT_RATE_LIMITS:
+        limit, window = ENDPOINT_RATE_LIMITS[request.path]
+        key = label = request.path
+        message = RATE_LIMIT_MESSAGES[request.path]
+    elif request.path.startswith(JOB_POLL_PREFIX):
+        limit, window = JOB_POLL_RATE_LIMIT
+        key = label = JOB_POLL_PREFIX
+        message = 'Too many status checks. Please wait a moment.'
+    else:
+        limit, window = DEFAULT_RATE_LIMIT
+        key, label = '', 'default'
+        message = 'Security Block: Too many requests from this IP. Please slow down.'
+
+    if not rate_limit_allow(f'{ip}::{key}' if key else ip, limit, window):
+        metric_inc('vpg_rate_limit_rejections_total', limit=label)
+        # Roughly when the sliding window frees the next slot
+        return (jsonify({'status': 'error', 'message': message}), 429,
+                {'Retry-After': str(max(1, window // limit))})
 
 @app.after_request
 def apply_security_headers(response):
@@ -118,6 +402,8 @@ def apply_security_headers(response):
     
     # Only apply CORS to API endpoints, never to sitemap/ads.txt/robots.txt
     if request.path.startswith('/api/'):
+        # Allow-Origin echoes the caller, so shared caches must key on Origin too
+        response.vary.add('Origin')
         origin = request.headers.get('Origin')
         if origin and ('.googleusercontent.com' in origin or 'sites.google.com' in origin or 'render.com' in origin):
             response.headers['Access-Control-Allow-Origin'] = origin
@@ -144,56 +430,672 @@ def handle_options(path):
 # ─────────────────────────────────────────────────────────────
 cache = {
     'prompts':    None,
-    'analytics':  None,
-    'comments':   None,
-    'last_update': 0
+    'comments':   None,   # approved comments, public fields only (raw event rows aren't kept)
+    'comments_from': 0,   # shared comments table range the list above mirrors
+    'comments_seq':  0,
+    'built_at':    0,
+    'generation':  0,   # bumped on every successful snapshot rebuild (shared by all workers)
+    'seen_invalidations': 0,  # invalidation count the snapshot was built after
+    'cursors':     {},  # delta-sync position per append-only worksheet
 }
 CACHE_TIMEOUT = 60  # 1 minute (fast updates for new prompts)
 
+# Stale-while-revalidate: requests always get the last snapshot immediately;
+# at most one rebuild runs at a time on a background thread.
+_refresh_lock     = threading.Lock()
+_refresh_state    = {'in_flight': False, 'invalidations': 0, 'last_attempt': 0}
+
+
+# ─────────────────────────────────────────────────────────────
+# SHARED SNAPSHOT STORE  (one copy for all gunicorn workers on a host)
+# A local SQLite file holds the latest snapshot, its generation and an
+# invalidation counter. Whichever worker holds the refresh lease rebuilds it;
+# the others just adopt newer generations. SNAPSHOT_DB='' keeps everything
+# per-process. Busy/locked errors are retried; any other SQLite failure falls
+# back to per-process mode for SQLITE_FAILOVER_COOLDOWN seconds, then the
+# store is tried again.
+# ─────────────────────────────────────────────────────────────
+SNAPSHOT_DB          = os.getenv('SNAPSHOT_DB', host_state_path('vpg_snapshot.db'))
+SHARED_POLL_INTERVAL = 1.0    # seconds between generation checks per worker
+REFRESH_LEASE_TTL    = 120    # a crashed leader's lease expires after this
+SQLITE_BUSY_RETRIES      = 3    # attempts while the database is busy/locked
+SQLITE_FAILOVER_COOLDOWN = 30   # seconds on the per-process fallback before retrying SQLite
+
+# Only derived data the handlers read is shared: no raw event rows. Approved
+# comments only ever grow between full reloads, so they live in their own
+# table, appended per delta, instead of being re-serialised into every blob;
+# the snapshot just names the comments_from..comments_seq range it includes.
+SHARED_SNAPSHOT_KEYS = ('prompts', 'cursors')
+
+_shared_local = threading.local()
+_shared_state = {'disabled': not SNAPSHOT_DB, 'retry_at': 0, 'checked_at': 0, 'meta': None}
+
+
+def _sqlite_busy(e):
+    return isinstance(e, sqlite3.OperationalError) and ('locked' in str(e) or 'busy' in str(e))
+
+
+def sqlite_retry(fn, *args):
+    """fn(*args), retried with a short backoff while the database is busy/locked."""
+    for attempt in range(SQLITE_BUSY_RETRIES):
+        try:
+            return fn(*args)
+        except sqlite3.OperationalError as e:
+            if not _sqlite_busy(e) or attempt == SQLITE_BUSY_RETRIES - 1:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+
+def _shared_db():
+    conn = getattr(_shared_local, 'conn', None)
+    if conn is None or _shared_local.pid != os.getpid():
+        conn = sqlite3.connect(SNAPSHOT_DB, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta ('
+                     'id INTEGER PRIMARY KEY CHECK (id = 1), generation INTEGER, built_at REAL, '
+                     'invalidations INTEGER, seen_invalidations INTEGER, lease_owner TEXT, lease_until REAL, '
+                     'flags_generation INTEGER DEFAULT 0)')
+        if 'flags_generation' not in [col[1] for col in conn.execute('PRAGMA table_info(meta)')]:
+            conn.execute('ALTER TABLE meta ADD COLUMN flags_generation INTEGER DEFAULT 0')
+        conn.execute('INSERT OR IGNORE INTO meta (id, generation, built_at, invalidations, seen_invalidations, '
+                     "lease_owner, lease_until) VALUES (1, 0, 0, 0, 0, '', 0)")
+        conn.execute('CREATE TABLE IF NOT EXISTS blobs (name TEXT PRIMARY KEY, updated_at REAL, data BLOB)')
+        conn.execute('CREATE TABLE IF NOT EXISTS comments (seq INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT)')
+        conn.execute('CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, owner TEXT, state TEXT, '
+                     'created REAL, updated REAL, http_status INTEGER, result TEXT)')
+        _shared_local.conn, _shared_local.pid = conn, os.getpid()
+    return conn
+
+
+def _shared_call(fn, default=None):
+    """Run fn(conn) against the shared store; on failure use per-process mode for a while."""
+    if _shared_state['disabled'] or time.time() < _shared_state['retry_at']:
+        return default
+    try:
+        return sqlite_retry(lambda: fn(_shared_db()))
+    except Exception as e:
+        print(f'shared snapshot store error, using per-process cache for {SQLITE_FAILOVER_COOLDOWN}s: {e}')
+        _shared_state['retry_at'] = time.time() + SQLITE_FAILOVER_COOLDOWN
+        _shared_local.conn = None   # reconnect on the next attempt
+        return default
+
+
+def _shared_meta():
+    row = _shared_call(lambda c: c.execute(
+        'SELECT generation, built_at, invalidations, seen_invalidations FROM meta WHERE id = 1').fetchone())
+    if row is None:
+        # Per-process mode: the local cache is the source of truth
+        return {'generation': cache['generation'], 'built_at': cache['built_at'],
+                'invalidations': _refresh_state['invalidations'],
+                'seen_invalidations': cache['seen_invalidations']}
+    return dict(zip(('generation', 'built_at', 'invalidations', 'seen_invalidations'), row))
+
+
+def shared_get_blob(name):
+    """Returns (updated_at, value) for a shared JSON blob, or (0, None)."""
+    row = _shared_call(lambda c: c.execute('SELECT updated_at, data FROM blobs WHERE name = ?', (name,)).fetchone())
+    if not row:
+        return 0, None
+    return row[0], json.loads(row[1])
+
+
+def shared_put_blob(name, value, updated_at=None):
+    data = json.dumps(value, separators=(',', ':'))
+    _shared_call(lambda c: c.execute('INSERT OR REPLACE INTO blobs (name, updated_at, data) VALUES (?, ?, ?)',
+                                     (name, updated_at or time.time(), data)))
+
+
+def _acquire_refresh_lease():
+    now, owner = time.time(), str(os.getpid())
+    acquired = _shared_call(lambda c: c.execute(
+        'UPDATE meta SET lease_owner = ?, lease_until = ? WHERE id = 1 AND (lease_until < ? OR lease_owner = ?)',
+        (owner, now + REFRESH_LEASE_TTL, now, owner)).rowcount == 1, default=True)
+    return acquired
+
+
+def _release_refresh_lease():
+    _shared_call(lambda c: c.execute(
+        "UPDATE meta SET lease_owner = '', lease_until = 0 WHERE id = 1 AND lease_owner = ?", (str(os.getpid()),)))
+
+
+def _publish_snapshot(snapshot, generation, built_at, seen_invalidations, comments, comments_from):
+    """comments: (approved comments, full). A full set replaces the shared comments
+    table; otherwise they are appended after the range starting at comments_from.
+    Returns the (comments_from, comments_seq) range published, or None."""
+    rows, full = comments
+
+    def publish(conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            start = comments_from
+            if full:
+                start = conn.execute("SELECT COALESCE((SELECT seq FROM sqlite_sequence "
+                                     "WHERE name = 'comments'), 0) + 1").fetchone()[0]
+                conn.execute('DELETE FROM comments')
+            conn.executemany('INSERT INTO comments (data) VALUES (?)',
+                             [(json.dumps(row, separators=(',', ':')),) for row in rows])
+            end = conn.execute('SELECT COALESCE(MAX(seq), ?) FROM comments', (start - 1,)).fetchone()[0]
+            blob = dict(snapshot, comments_from=start, comments_seq=end)
+            conn.execute('INSERT OR REPLACE INTO blobs (name, updated_at, data) VALUES (?, ?, ?)',
+                         ('snapshot', built_at, json.dumps(blob, separators=(',', ':'))))
+            conn.execute('UPDATE meta SET generation = ?, built_at = ?, seen_invalidations = ? WHERE id = 1',
+                         (generation, built_at, seen_invalidations))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return start, end
+    return _shared_call(publish)
+
+
+def _shared_comments(snapshot):
+    """The approved comments in a published snapshot's range, reusing the ones
+    already held when only new rows were appended. None if unavailable."""
+    start, end = snapshot.get('comments_from'), snapshot.get('comments_seq')
+    if start is None:
+        return None
+    base, after = [], start - 1
+    if cache['comments'] is not None and cache['comments_from'] == start and cache['comments_seq'] <= end:
+        base, after = cache['comments'], cache['comments_seq']
+    rows = _shared_call(lambda c: c.execute('SELECT data FROM comments WHERE seq > ? AND seq <= ? ORDER BY seq',
+                                            (after, end)).fetchall())
+    if rows is None:
+        return None
+    return base + [json.loads(data) for (data,) in rows]
+
+
+def _poll_shared(force=False):
+    """Adopt a newer snapshot published by another worker. Returns the current meta."""
+    now = time.time()
+    meta = _shared_state['meta']
+    if force or meta is None or now - _shared_state['checked_at'] >= SHARED_POLL_INTERVAL:
+        meta = _shared_meta()
+        _shared_state['meta'], _shared_state['checked_at'] = meta, now
+    if meta['generation'] > cache['generation']:
+        _, snapshot = shared_get_blob('snapshot')
+        comments = _shared_comments(snapshot) if snapshot else None
+        if comments is not None:
+            set_counters(snapshot.get('counters', {}))
+            with _refresh_lock:
+                cache.update({k: snapshot[k] for k in SHARED_SNAPSHOT_KEYS if k in snapshot})
+                cache['comments'] = comments
+                cache['comments_from'] = snapshot['comments_from']
+                cache['comments_seq'] = snapshot['comments_seq']
+                cache['generation'] = meta['generation']
+                cache['built_at'] = meta['built_at']
+                cache['seen_invalidations'] = meta['seen_invalidations']
+    return meta
+
+
+def _snapshot_is_stale(meta):
+    return (time.time() - meta['built_at'] >= CACHE_TIMEOUT
+            or meta['invalidations'] != meta['seen_invalidations'])
+
 
 def invalidate_cache():
-    cache['last_update'] = 0
+    """Mark the snapshot stale (for every worker) and start rebuilding it."""
+    with _refresh_lock:
+        _refresh_state['invalidations'] += 1
+    _shared_call(lambda c: c.execute('UPDATE meta SET invalidations = invalidations + 1 WHERE id = 1'))
+    # Start rebuilding right away so the next reader sees fresh data sooner
+    if cache['prompts'] is not None:
+        _start_background_refresh(force=True)
+
+
+def write_through_prompts(change):
+    """Admin writes: apply change(prompts) -> prompts to the current snapshot and
+    publish it as a new generation, so every worker serves the edit at once.
+    Callers then invalidate_cache() to reconcile with the sheet in the background."""
+    meta = _poll_shared(force=True)
+    with _refresh_lock:
+        if cache['prompts'] is None:
+            return
+        generation = max(meta['generation'], cache['generation']) + 1
+        cache['prompts'] = change(list(cache['prompts']))
+        cache['generation'] = generation
+        snapshot = dict({k: cache[k] for k in SHARED_SNAPSHOT_KEYS}, counters=counters_snapshot())
+        comments_from = cache['comments_from']
+        comments = ([], False) if comments_from else (cache['comments'] or [], True)
+        built_at, seen = cache['built_at'], cache['seen_invalidations']
+    published = _publish_snapshot(snapshot, generation, built_at, seen, comments, comments_from)
+    with _refresh_lock:
+        cache['comments_from'], cache['comments_seq'] = published or (0, 0)
+    _shared_state['meta'] = None
+
+
+def cache_age():
+    """Seconds since the current snapshot was built (None before the first load)."""
+    if not cache['generation']:
+        return None
+    return max(0.0, time.time() - cache['built_at'])
+
+
+# ─────────────────────────────────────────────────────────────
+# COUNTERS  (per-prompt like / comment / visit totals)
+# Kept incrementally so /api/v1/prompts never has to ship raw event rows.
+# ─────────────────────────────────────────────────────────────
+_counters = {}                    # {prompt_id: {'likes': n, 'comments': n, 'visits': n}}
+_pending  = {}                    # {prompt_id: {kind: deque of bump times}} not yet seen in a sheet read
+_counters_lock = threading.Lock()
+_counters_state = {'version': 0}  # bumped on every change; keys the serialized payload
+_COUNTER_EVENTS = {'like': 'likes', 'visit': 'visits'}
+_COUNTER_SOURCES = {'analytics': ('likes', 'visits'), 'comments': ('comments',)}   # sheet key -> totals
+PENDING_TTL = 900   # a write-through bump whose row hasn't been read back by then is taken as lost
+
+
+def _counter_slot(prompt_id):
+    return _counters.setdefault(str(prompt_id), {'likes': 0, 'comments': 0, 'visits': 0})
+
+
+def _count_event(pid, kind):
+    # A row we already counted write-through only settles its pending bump
+    bumps = _pending.get(pid, {}).get(kind)
+    if bumps:
+        bumps.popleft()
+        return
+    _counter_slot(pid)[kind] += 1
+
+
+def _expire_pending(now):
+    """Take bumps whose rows never showed up (lost writes) back out of the totals."""
+    for pid, slots in list(_pending.items()):
+        for kind, bumps in list(slots.items()):
+            while bumps and now - bumps[0] > PENDING_TTL:
+                bumps.popleft()
+                slot = _counter_slot(pid)
+                slot[kind] = max(0, slot[kind] - 1)
+            if not bumps:
+                del slots[kind]
+        if not slots:
+            del _pending[pid]
+
+
+def _apply_counter_rows(analytics_rows, comment_rows, reset=()):
+    """Fold Analytics / Comments sheet rows into the counters.
+    reset lists the sheets ('analytics', 'comments') that were reloaded in full:
+    their totals are rebuilt from the rows; other rows are treated as new events."""
+    with _counters_lock:
+        _counters_state['version'] += 1
+        for source in reset:
+            for kind in _COUNTER_SOURCES[source]:
+                for slot in _counters.values():
+                    slot[kind] = 0
+                for slot in _pending.values():
+                    slot.pop(kind, None)
+        for row in analytics_rows or []:
+            kind = _COUNTER_EVENTS.get(str(row.get('Event Type', '')).strip().lower())
+            pid = str(row.get('Prompt ID', '')).strip()
+            if kind and pid and pid != 'N/A':
+                _count_event(pid, kind)
+        for row in comment_rows or []:
+            if not _comment_is_approved(row):
+                continue
+            pid = str(row.get('Prompt ID', '')).strip()
+            if pid:
+                _count_event(pid, 'comments')
+        _expire_pending(time.time())
+
+
+def bump_counter(prompt_id, kind, n=1):
+    """Write-through update after a successful interaction/analytics write."""
+    pid = str(prompt_id or '').strip()
+    if not pid or pid == 'N/A':
+        return
+    with _counters_lock:
+        _counter_slot(pid)[kind] += n
+        _pending.setdefault(pid, {}).setdefault(kind, deque()).extend([time.time()] * n)
+        if kind != 'visits':   # visits aren't part of the public payload
+            _counters_state['version'] += 1
+
+
+def drop_pending(prompt_id, kind):
+    """Undo a write-through bump whose row was discarded before reaching the sheet."""
+    pid = str(prompt_id or '').strip()
+    with _counters_lock:
+        bumps = _pending.get(pid, {}).get(kind)
+        if not bumps:
+            return
+        bumps.pop()
+        if not bumps:
+            del _pending[pid][kind]
+        slot = _counter_slot(pid)
+        slot[kind] = max(0, slot[kind] - 1)
+        if kind != 'visits':
+            _counters_state['version'] += 1
+
+
+def counters_snapshot():
+    with _counters_lock:
+        return {pid: dict(c) for pid, c in _counters.items()}
+
+
+def set_counters(counters):
+    """Adopt counters published with a shared snapshot."""
+    with _counters_lock:
+        _counters_state['version'] += 1
+        _counters.clear()
+        _pending.clear()
+        _counters.update({pid: dict(c) for pid, c in counters.items()})
+
+
+def public_counts():
+    """Compact {prompt_id: {likes, comments}} map for the public API."""
+    with _counters_lock:
+        return {
+            pid: {'likes': c['likes'], 'comments': c['comments']}
+            for pid, c in _counters.items()
+            if c['likes'] or c['comments']
+        }
 
 
 # ─────────────────────────────────────────────────────────────
 # GOOGLE SHEETS HELPERS
 # ─────────────────────────────────────────────────────────────
-def get_google_client():
-    scope = [
-        'https://spreadsheets.google.com/feeds',
-        'https://www.googleapis.com/auth/drive'
-    ]
-    if GOOGLE_CREDENTIALS:
-        creds_dict = json.loads(GOOGLE_CREDENTIALS)
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-    else:
-        creds = ServiceAccountCredentials.from_json_keyfile_name('credentials.json', scope)
-    return gspread.authorize(creds)
+# One authorized client per process. gspread's AuthorizedSession keeps the
+# HTTP connection pool alive and refreshes the access token only when it expires.
+_sheets_lock = threading.RLock()
+_sheets = {'client': None, 'spreadsheet': None, 'worksheets': {}, 'headers': {}}
+_PROMPTS_SHEET = '__sheet1__'   # worksheet-cache key for the first (prompts) tab
 
 
-def fetch_data():
-    now = time.time()
-    if cache['prompts'] and (now - cache['last_update'] < CACHE_TIMEOUT):
-        return cache
+def metered_sheets_call(worksheet, operation, fn, *args, **kwargs):
+    """Call fn, counting and timing it as one Sheets API call for /metrics."""
+    started = time.perf_counter()
+    outcome = 'error'
     try:
-        client = get_google_client()
-        ss = client.open_by_key(GOOGLE_SHEET_ID)
+        result = fn(*args, **kwargs)
+        outcome = 'ok'
+        return result
+    finally:
+        metric_inc('vpg_sheets_calls_total', worksheet=worksheet, operation=operation, outcome=outcome)
+        metric_observe('vpg_sheets_call_seconds', time.perf_counter() - started,
+                       worksheet=worksheet, operation=operation)
 
-        cache['prompts'] = ss.sheet1.get_all_records()
 
-        try:
-            cache['analytics'] = ss.worksheet('Analytics').get_all_records()
-        except Exception:
-            cache['analytics'] = []
+class MeteredWorksheet:
+    """Worksheet proxy whose method calls go through metered_sheets_call."""
+
+    def __init__(self, sheet):
+        self._sheet = sheet
+
+    def __getattr__(self, name):
+        attr = getattr(self._sheet, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        return lambda *args, **kwargs: metered_sheets_call(self._sheet.title, name, attr, *args, **kwargs)
+
+
+def get_google_client():
+    with _sheets_lock:
+        if _sheets['client'] is not None:
+            return _sheets['client']
+        scope = [
+            'https://spreadsheets.google.com/feeds',
+            'https://www.googleapis.com/auth/drive'
+        ]
+        if GOOGLE_CREDENTIALS:
+            creds_dict = json.loads(GOOGLE_CREDENTIALS)
+            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+        else:
+            creds = ServiceAccountCredentials.from_json_keyfile_name('credentials.json', scope)
+        _sheets['client'] = gspread.authorize(creds)
+        return _sheets['client']
+
+
+def get_spreadsheet():
+    """Cached Spreadsheet handle — open_by_key() costs a metadata round trip."""
+    with _sheets_lock:
+        if _sheets['spreadsheet'] is None:
+            _sheets['spreadsheet'] = metered_sheets_call('(spreadsheet)', 'open_by_key',
+                                                         get_google_client().open_by_key, GOOGLE_SHEET_ID)
+        return _sheets['spreadsheet']
+
+
+def get_worksheet(title=None, headers=None, rows=10000, on_create=None):
+    """Cached Worksheet handle by title (None = the prompts sheet).
+    When headers are given, a missing worksheet is created with that header row."""
+    key = title or _PROMPTS_SHEET
+    with _sheets_lock:
+        sheet = _sheets['worksheets'].get(key)
+        if sheet is not None:
+            return sheet
+        ss = get_spreadsheet()
+        if title is None:
+            sheet = MeteredWorksheet(metered_sheets_call('(spreadsheet)', 'sheet1', lambda: ss.sheet1))
+        else:
+            try:
+                sheet = MeteredWorksheet(metered_sheets_call('(spreadsheet)', 'worksheet', ss.worksheet, title))
+            except gspread.exceptions.WorksheetNotFound:
+                if not headers:
+                    raise
+                sheet = MeteredWorksheet(metered_sheets_call('(spreadsheet)', 'add_worksheet', ss.add_worksheet,
+                                                             title=title, rows=rows, cols=len(headers)))
+                sheet.update(f'A1:{chr(ord("A") + len(headers) - 1)}1', [headers])
+                if on_create:
+                    on_create(sheet)
+        _sheets['worksheets'][key] = sheet
+        return sheet
+
+
+def reset_google_client(drop_client=False):
+    """Forget cached handles (e.g. after a worksheet was renamed or deleted)."""
+    with _sheets_lock:
+        _sheets['spreadsheet'] = None
+        _sheets['worksheets'].clear()
+        _sheets['headers'].clear()
+        if drop_client:
+            _sheets['client'] = None
+
+
+# Writes address cells by header name through a cached header row, and all
+# cells of one logical edit go out in a single values:batchUpdate request.
+HEADER_CACHE_TTL = 300  # seconds; columns are rarely rearranged by hand
+
+
+def sheet_headers(sheet, refresh=False):
+    """Header row of a worksheet, cached per title."""
+    with _sheets_lock:
+        hit = _sheets['headers'].get(sheet.title)
+    if hit and not refresh and time.time() - hit[0] < HEADER_CACHE_TTL:
+        return list(hit[1])
+    headers = sheet.row_values(1)
+    remember_sheet_headers(sheet, headers)
+    return list(headers)
+
+
+def remember_sheet_headers(sheet, headers):
+    with _sheets_lock:
+        _sheets['headers'][sheet.title] = (time.time(), list(headers))
+
+
+def ensure_sheet_columns(sheet, names):
+    """Append any missing header columns. Returns the (possibly extended) header row."""
+    headers = sheet_headers(sheet)
+    missing = [n for n in names if n not in headers]
+    if missing:
+        headers = sheet_headers(sheet, refresh=True)
+        missing = [n for n in names if n not in headers]
+    if missing:
+        headers += missing
+        sheet.update(f'A1:{gspread.utils.rowcol_to_a1(1, len(headers))}', [headers])
+        remember_sheet_headers(sheet, headers)
+    return headers
+
+
+def batch_write_cells(sheet, cells):
+    """Write [(row, col, value), ...] in one API call, entered as if typed
+    (same as update_cell)."""
+    if not cells:
+        return
+    sheet.batch_update(
+        [{'range': gspread.utils.rowcol_to_a1(r, c), 'values': [[v]]} for r, c, v in cells],
+        value_input_option=gspread.utils.ValueInputOption.user_entered,
+    )
+
+
+# Analytics and Comments are only ever appended to, so after the first full
+# read a refresh fetches just the rows below the last one it saw. The last
+# row is re-read as a checksum: if it changed or vanished, rows were edited or
+# deleted and the sheet is reloaded in full. A periodic full reload also
+# catches edits further up.
+# The rows read only feed the counters; beyond the cursor, nothing but the
+# approved comments' public columns is kept.
+APPEND_ONLY_SHEETS    = {'analytics': 'Analytics', 'comments': 'Comments'}
+APPEND_ONLY_FULL_SYNC = 3600  # seconds between forced full reloads
+# Comment columns that are public; Status, IPs etc. never leave the server
+PUBLIC_COMMENT_FIELDS = ('Timestamp', 'Prompt ID', 'Name', 'Comment')
+
+
+def _trim_row(values):
+    values = [str(v) for v in values]
+    while values and values[-1] == '':
+        values.pop()
+    return values
+
+
+def _to_record(headers, values):
+    values = list(values) + [''] * (len(headers) - len(values))
+    # Same numeric conversion get_all_records() applies
+    return dict(zip(headers, gspread.utils.numericise_all(values[:len(headers)])))
+
+
+def _comment_is_approved(row):
+    return str(row.get('Status', 'approved')).strip().lower() == 'approved'
 
-        try:
-            cache['comments'] = ss.worksheet('Comments').get_all_records()
-        except Exception:
-            cache['comments'] = []
 
-        cache['last_update'] = now
+def _public_comment(row):
+    return {k: row.get(k, '') for k in PUBLIC_COMMENT_FIELDS}
+
+
+def _read_append_only(title, cursor):
+    """Returns (rows, full, cursor): the rows added since cursor, or every row
+    with full=True when the sheet was reloaded from scratch."""
+    try:
+        sheet = get_worksheet(title)
+    except gspread.exceptions.WorksheetNotFound:
+        return [], True, None
+    now = time.time()
+    try:
+        if cursor and cursor['headers'] and now - cursor['full_at'] < APPEND_ONLY_FULL_SYNC:
+            n = cursor['rows']
+            end_col = re.sub(r'\d', '', gspread.utils.rowcol_to_a1(1, len(cursor['headers'])))
+            # Row n + 1 is the last row already read (row 1 holds the headers)
+            values = sheet.get(f'A{n + 1}:{end_col}')
+            if values and _trim_row(values[0]) == cursor['last_row']:
+                fresh = list(values[1:])
+                new_rows = [_to_record(cursor['headers'], v) for v in fresh]
+                last_row = _trim_row(fresh[-1]) if fresh else cursor['last_row']
+                return new_rows, False, dict(cursor, rows=n + len(fresh), last_row=last_row)
+
+        values = sheet.get_all_values()
+        headers = values[0] if values else []
+        rows = [_to_record(headers, v) for v in values[1:]]
+        cursor = {'headers': headers, 'rows': len(rows), 'full_at': now,
+                  'last_row': _trim_row(values[-1]) if values else []}
+        return rows, True, cursor
+    except Exception as e:
+        # Keep serving what we had; the cursor is untouched so nothing is skipped
+        print(f'{title} sync error: {e}')
+        return [], False, cursor
+
+
+def _load_snapshot():
+    """Read every worksheet the public API needs. Raises on Sheets failure.
+    The Analytics / Comments rows read are returned under 'events' as
+    {sheet key: (rows, full)} for the counters and not stored."""
+    snapshot = {'prompts': get_worksheet().get_all_records(), 'cursors': {}, 'events': {}}
+    prev_cursors = cache.get('cursors') or {}
+    for key, title in APPEND_ONLY_SHEETS.items():
+        rows, full, cursor = _read_append_only(title, prev_cursors.get(key))
+        snapshot['events'][key] = (rows, full)
+        snapshot['cursors'][key] = cursor
+    rows, full = snapshot['events']['comments']
+    approved = [_public_comment(r) for r in rows if _comment_is_approved(r)]
+    snapshot['new_comments'] = approved
+    snapshot['comments'] = approved if full else (cache['comments'] or []) + approved
+    return snapshot
+
+
+def _refresh_snapshot():
+    """Rebuild the snapshot and publish it to every worker. Returns True on success,
+    False on failure and None when another thread/worker is already rebuilding
+    (single-flight per process and, through the lease, per host)."""
+    with _refresh_lock:
+        if _refresh_state['in_flight']:
+            return None
+        _refresh_state['in_flight'] = True
+    leased = False
+    try:
+        leased = _acquire_refresh_lease()
+        if not leased:
+            return None
+        # Continue from the newest published snapshot so delta cursors line up
+        meta = _poll_shared(force=True)
+        started = time.time()
+        snapshot = _load_snapshot()
+        events = snapshot.pop('events')
+        new_comments = snapshot.pop('new_comments')
+        # Rewrite the shared comments in full unless they are known to match ours
+        comments_from = cache['comments_from']
+        comments = (new_comments, False) if comments_from and not events['comments'][1] else (snapshot['comments'], True)
+        _apply_counter_rows(events['analytics'][0], events['comments'][0],
+                            reset=[key for key, (_, full) in events.items() if full])
+        generation = max(meta['generation'], cache['generation']) + 1
+        with _refresh_lock:
+            cache.update(snapshot)
+            cache['built_at'] = started
+            cache['generation'] = generation
+            # An invalidation that lands mid-fetch may not be reflected; it keeps
+            # invalidations ahead of seen_invalidations, so the snapshot stays stale
+            cache['seen_invalidations'] = meta['invalidations']
+        published = _publish_snapshot(dict({k: snapshot[k] for k in SHARED_SNAPSHOT_KEYS}, counters=counters_snapshot()),
+                                      generation, started, meta['invalidations'], comments, comments_from)
+        with _refresh_lock:
+            cache['comments_from'], cache['comments_seq'] = published or (0, 0)
+        _shared_state['meta'] = None
+        return True
     except Exception as e:
         print(f'fetch_data error: {e}')
+        reset_google_client()
+        return False
+    finally:
+        if leased:
+            _release_refresh_lease()
+        with _refresh_lock:
+            _refresh_state['in_flight'] = False
+
+
+def _start_background_refresh(force=False):
+    now = time.time()
+    if _refresh_state['in_flight'] or (not force and now - _refresh_state['last_attempt'] < 1):
+        return
+    _refresh_state['last_attempt'] = now
+    threading.Thread(target=_refresh_snapshot, name='snapshot-refresh', daemon=True).start()
+
+
+_cold_start_lock = threading.Lock()
+
+
+def fetch_data():
+    """Return the current snapshot without ever waiting on Sheets once one exists."""
+    meta = _poll_shared()
+    if cache['prompts'] is None:
+        metric_inc('vpg_cache_requests_total', cache='snapshot', result='miss')
+        # Cold start: nothing to serve yet. One caller loads inline while the
+        # rest wait for it (or for another worker to publish) instead of stampeding.
+        with _cold_start_lock:
+            deadline = time.time() + 20
+            while cache['prompts'] is None and time.time() < deadline:
+                if _refresh_snapshot() is not None:
+                    break
+                time.sleep(0.25)
+                _poll_shared(force=True)
+        return cache
+    if _snapshot_is_stale(meta):
+        metric_inc('vpg_cache_requests_total', cache='snapshot', result='stale')
+        _start_background_refresh()
+    else:
+        metric_inc('vpg_cache_requests_total', cache='snapshot', result='hit')
     return cache
 
 
@@ -242,26 +1144,58 @@ def _decrypt_api_key(encrypted_key):
 
 def _get_users_sheet():
     """Get or create the 'Users' worksheet."""
-    client = get_google_client()
-    ss = client.open_by_key(GOOGLE_SHEET_ID)
-    try:
-        sheet = ss.worksheet('Users')
-    except gspread.exceptions.WorksheetNotFound:
-        sheet = ss.add_worksheet(title='Users', rows=10000, cols=6)
-        sheet.update('A1:F1', [['Name', 'Email', 'Password Hash', 'API Key (encrypted)', 'Created At', 'Last Login']])
-    return sheet
+    return get_worksheet('Users', headers=['Name', 'Email', 'Password Hash', 'API Key (encrypted)', 'Created At', 'Last Login'])
+
 
+# Email → (row_number, record) index over the Users sheet, so auth and image
+# generation don't scan the whole sheet per request.
+USER_INDEX_TTL        = 300  # seconds before a full reload
+USER_INDEX_MISS_RELOAD = 10  # a miss reloads at most this often (other workers may have registered)
+_user_index = {'by_email': {}, 'headers': [], 'loaded_at': 0}
+_user_index_lock = threading.Lock()
 
-def _find_user_by_email(email):
-    """Find user row by email. Returns (row_number, row_dict) or (None, None)."""
+
+def _load_user_index():
     sheet = _get_users_sheet()
-    records = sheet.get_all_records()
-    for i, row in enumerate(records, start=2):
-        if str(row.get('Email', '')).strip().lower() == email.strip().lower():
-            return i, row
+    values = sheet.get_all_values()
+    headers = values[0] if values else []
+    by_email = {}
+    for i, row in enumerate(values[1:], start=2):
+        record = dict(zip(headers, row + [''] * (len(headers) - len(row))))
+        email = str(record.get('Email', '')).strip().lower()
+        if email and email not in by_email:
+            by_email[email] = (i, record)
+    _user_index.update(by_email=by_email, headers=headers, loaded_at=time.time())
+
+
+def _find_user_by_email(email, authoritative=False):
+    """Find user row by email. Returns (row_number, row_dict) or (None, None).
+    authoritative=True always re-reads the sheet before reporting a miss (used by register)."""
+    email = email.strip().lower()
+    with _user_index_lock:
+        age = time.time() - _user_index['loaded_at']
+        miss_reload = USER_INDEX_MISS_RELOAD if not authoritative else 0
+        if age >= USER_INDEX_TTL or (email not in _user_index['by_email'] and age >= miss_reload):
+            _load_user_index()
+        hit = _user_index['by_email'].get(email)
+    if hit:
+        return hit[0], dict(hit[1])
     return None, None
 
 
+def _index_user(row_num, record):
+    """Write-through: record a newly written/updated user row in the index."""
+    email = str(record.get('Email', '')).strip().lower()
+    with _user_index_lock:
+        _user_index['by_email'][email] = (row_num, dict(record))
+
+
+def _user_column(name):
+    """1-based column of a Users header, from the cached header row."""
+    headers = _user_index['headers'] or _get_users_sheet().row_values(1)
+    return headers.index(name) + 1
+
+
 def _get_user_api_key(email):
     """Retrieve and decrypt the API key for the logged-in user."""
     _, user = _find_user_by_email(email)
@@ -294,7 +1228,7 @@ def user_register():
 
     try:
         # Check if email already exists
-        existing_row, _ = _find_user_by_email(email)
+        existing_row, _ = _find_user_by_email(email, authoritative=True)
         if existing_row:
             return jsonify({'status': 'error', 'message': 'An account with this email already exists. Please login.'}), 409
 
@@ -302,7 +1236,14 @@ def user_register():
         sheet = _get_users_sheet()
         password_hash = _hash_password(password)
         encrypted_key = _encrypt_api_key(api_key)
-        sheet.append_row([name, email, password_hash, encrypted_key, ts(), ts()])
+        now = ts()
+        row = [name, email, password_hash, encrypted_key, now, now]
+        result = sheet.append_row(row)
+        updated_range = (result or {}).get('updates', {}).get('updatedRange', '')
+        m = re.search(r'(\d+):', updated_range)
+        if m:
+            _index_user(int(m.group(1)), dict(zip(
+                ['Name', 'Email', 'Password Hash', 'API Key (encrypted)', 'Created At', 'Last Login'], row)))
 
         # Auto-login after registration
         session['user_email'] = email
@@ -335,10 +1276,9 @@ def user_login():
 
         # Update last login
         try:
-            sheet = _get_users_sheet()
-            headers = sheet.row_values(1)
-            last_login_col = headers.index('Last Login') + 1
-            sheet.update_cell(row_num, last_login_col, ts())
+            login_ts = ts()
+            _get_users_sheet().update_cell(row_num, _user_column('Last Login'), login_ts)
+            _index_user(row_num, dict(user, **{'Last Login': login_ts}))
         except Exception:
             pass
 
@@ -438,18 +1378,162 @@ def blog_scifi():
     return render_template('blog_scifi.html')
 
 
+# ─────────────────────────────────────────────────────────────
+# PROMPT DETAIL PAGES
+# Deep links render one prompt on the server from the cached snapshot, so
+# visitors see it without app.js or the full /api/v1/prompts download.
+# Rendered HTML is kept in an LRU keyed by (generation, prompt ID); a new
+# snapshot simply stops matching the old entries.
+# ─────────────────────────────────────────────────────────────
+PROMPT_PAGE_CACHE_SIZE = 512
+PROMPT_PAGE_RETRY_AFTER = 30   # seconds, on the 503 served before any snapshot exists
+_prompt_pages = OrderedDict()   # (generation, prompt ID) -> {'html', 'etag'}
+_prompt_pages_lock = threading.Lock()
+_prompt_index = {'current': (None, {})}   # generation, {prompt ID: record}
+
+
+def _prompt_by_id(prompt_id):
+    generation, index = _prompt_index['current']
+    if generation != cache['generation']:
+        generation = cache['generation']
+        index = {str(p.get('Unique ID', '')).strip(): p for p in cache['prompts'] or []}
+        _prompt_index['current'] = (generation, index)
+    return generation, index.get(prompt_id)
+
+
+def _render_prompt_page(prompt_id, prompt):
+    if not prompt:
+        return render_template('prompt.html', prompt=None), 404
+    canonical = f'{SITEMAP_BASE}/prompt/{quote(prompt_id)}'
+    structured_data = {
+        '@context': 'https://schema.org',
+        '@type': 'CreativeWork',
+        'name': prompt.get('Prompt Name') or 'Untitled',
+        'text': str(prompt.get('Prompt', '')),
+        'genre': prompt.get('Category') or 'General',
+        'url': canonical,
+    }
+    if prompt.get('Image URL'):
+        structured_data['image'] = prompt['Image URL']
+    published = _sitemap_date(prompt.get('Timestamp', ''))
+    if published:
+        structured_data['datePublished'] = published
+    html = render_template('prompt.html', prompt=prompt, canonical=canonical,
+                           renditions=image_renditions(prompt.get('Image URL', '')),
+                           structured_data=structured_data)
+    return html, 200
+
+
+@app.route('/prompt/<prompt_id>')
+def prompt_page(prompt_id):
+    try:
+        fetch_data()
+    except Exception:
+        pass
+    prompt_id = prompt_id.strip()
+    if cache['prompts'] is None:
+        # No snapshot loaded yet (cold start, Sheets down): a 404 here would tell
+        # crawlers to drop a page that may well exist, so ask them to come back
+        html = render_template('prompt.html', prompt=None, unavailable=True)
+        return Response(html, status=503, mimetype='text/html',
+                        headers={'Retry-After': str(PROMPT_PAGE_RETRY_AFTER), 'Cache-Control': 'no-store'})
+    generation, prompt = _prompt_by_id(prompt_id)
+    key = (generation, prompt_id)
+    with _prompt_pages_lock:
+        page = _prompt_pages.get(key)
+        if page:
+            _prompt_pages.move_to_end(key)
+    if page is None:
+        html, status = _render_prompt_page(prompt_id, prompt)
+        body = html.encode('utf-8')
+        if status != 200:
+            # Don't let requests for made-up IDs push real pages out of the LRU
+            return Response(body, status=status, mimetype='text/html')
+        page = {'html': body, 'etag': hashlib.sha256(body).hexdigest()[:32]}
+        with _prompt_pages_lock:
+            _prompt_pages[key] = page
+            while len(_prompt_pages) > PROMPT_PAGE_CACHE_SIZE:
+                _prompt_pages.popitem(last=False)
+
+    headers = {
+        'Cache-Control': 'public, max-age=300',
+        'ETag': f'"{page["etag"]}"',
+    }
+    if request.if_none_match.contains_weak(page['etag']):
+        return Response(status=304, headers=headers)
+    return Response(page['html'], mimetype='text/html', headers=headers)
+
+
 
 # ─────────────────────────────────────────────────────────────
 # API — Public Data
 # ─────────────────────────────────────────────────────────────
+# Serialized once per snapshot/counter change into identity, gzip and brotli
+# buffers with a content-hash ETag; requests just pick a buffer (or 304).
+_prompts_payload = {'current': None}
+_prompts_payload_lock = threading.Lock()
+
+
+def _prompts_payload_bytes():
+    key = (cache['generation'], _counters_state['version'])
+    payload = _prompts_payload['current']
+    if payload and payload['key'] == key:
+        return payload
+    with _prompts_payload_lock:
+        payload = _prompts_payload['current']
+        if payload and payload['key'] == key:
+            return payload
+        # Raw Analytics / Comments rows stay server-side; only per-prompt totals ship.
+        prompts = cache['prompts'] or []
+        images = {}
+        for p in prompts:
+            renditions = image_renditions(p.get('Image URL', ''))
+            if renditions and p.get('Unique ID'):
+                images[str(p['Unique ID'])] = renditions
+        raw = json.dumps({
+            'prompts': prompts,
+            'counts':  public_counts(),
+            'images':  images,
+        }, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        payload = {
+            'key':      key,
+            'etag':     hashlib.sha256(raw).hexdigest()[:32],
+            'identity': raw,
+            'gzip':     gzip.compress(raw, compresslevel=6),
+            'br':       brotli.compress(raw, quality=9) if brotli else None,
+        }
+        _prompts_payload['current'] = payload
+        return payload
+
+
 @app.route('/api/v1/prompts')
 def get_prompts():
-    data = fetch_data()
-    return jsonify({
-        'prompts':   data['prompts']   or [],
-        'analytics': data['analytics'] or [],
-        'comments':  data['comments']  or [],
-    })
+    fetch_data()
+    payload = _prompts_payload_bytes()
+    etag = payload['etag']
+
+    if payload['br'] and 'br' in request.accept_encodings:
+        body, encoding, tag = payload['br'], 'br', f'{etag}-br'
+    elif 'gzip' in request.accept_encodings:
+        body, encoding, tag = payload['gzip'], 'gzip', f'{etag}-gz'
+    else:
+        body, encoding, tag = payload['identity'], None, etag
+
+    headers = {
+        # Always revalidate; an unchanged snapshot costs a 304 with no body
+        'Cache-Control': 'public, no-cache',
+        'Vary': 'Accept-Encoding, Origin',
+        'ETag': f'"{tag}"',
+    }
+    age = cache_age()
+    if age is not None:
+        headers['X-Snapshot-Age'] = str(int(age))
+
+    if any(request.if_none_match.contains_weak(t) for t in (etag, f'{etag}-br', f'{etag}-gz')):
+        return Response(status=304, headers=headers)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype='application/json', headers=headers)
 
 
 @app.route('/api/v1/interaction', methods=['POST'])
@@ -459,13 +1543,11 @@ def interaction():
     prompt_id = body.get('prompt_id', '')
 
     try:
-        client = get_google_client()
-        ss     = client.open_by_key(GOOGLE_SHEET_ID)
-
         if action == 'like':
-            sheet = ss.worksheet('Analytics')
+            sheet = get_worksheet('Analytics')
             sheet.append_row([ts(), prompt_id, 'like', 'N/A', '', 'success'])
-            invalidate_cache()
+            # Counters are updated write-through, so a like no longer forces a full reload
+            bump_counter(prompt_id, 'likes')
             return jsonify({'status': 'success'})
 
         elif action == 'comment':
@@ -473,8 +1555,9 @@ def interaction():
             comment = body.get('comment', '').strip()
             if not comment:
                 return jsonify({'status': 'error', 'message': 'Comment is empty'}), 400
-            sheet = ss.worksheet('Comments')
+            sheet = get_worksheet('Comments')
             sheet.append_row([ts(), prompt_id, name, comment[:5000], 'approved', 'N/A'])
+            bump_counter(prompt_id, 'comments')
             invalidate_cache()
             return jsonify({'status': 'success'})
 
@@ -484,6 +1567,90 @@ def interaction():
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+# ─────────────────────────────────────────────────────────────
+# ANALYTICS WRITE-BEHIND QUEUE
+# Visits are buffered in memory and flushed with one append_rows() per
+# interval (or as soon as a batch fills), instead of one Sheets write each.
+# ─────────────────────────────────────────────────────────────
+ANALYTICS_HEADERS        = ['Timestamp', 'Prompt ID', 'Event Type', 'User IP', 'Error Message', 'Status']
+ANALYTICS_BATCH_SIZE     = int(os.getenv('ANALYTICS_BATCH_SIZE', '50'))
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '10'))  # seconds
+ANALYTICS_QUEUE_MAX      = int(os.getenv('ANALYTICS_QUEUE_MAX', '5000'))       # rows kept in memory
+ANALYTICS_MAX_RETRIES    = 4
+
+_analytics_queue  = deque()
+_analytics_lock   = threading.Lock()
+_analytics_wakeup = threading.Event()
+_analytics_state  = {'thread': None, 'dropped': 0, 'written': 0}
+
+
+def enqueue_analytics(row):
+    """Buffer one Analytics row. Returns False if the queue is full and the row was dropped."""
+    with _analytics_lock:
+        if len(_analytics_queue) >= ANALYTICS_QUEUE_MAX:
+            _analytics_state['dropped'] += 1
+            return False
+        _analytics_queue.append(row)
+        pending = len(_analytics_queue)
+        thread = _analytics_state['thread']
+        if thread is None or not thread.is_alive():
+            # Started lazily so each gunicorn worker gets its own writer after fork
+            thread = threading.Thread(target=_analytics_writer, name='analytics-writer', daemon=True)
+            _analytics_state['thread'] = thread
+            thread.start()
+    if pending >= ANALYTICS_BATCH_SIZE:
+        _analytics_wakeup.set()
+    return True
+
+
+def _flush_analytics(final=False):
+    """Write everything queued in a single append_rows(), retrying with backoff.
+    On repeated failure the rows go back to the front of the queue (space permitting)."""
+    with _analytics_lock:
+        batch = list(_analytics_queue)
+        _analytics_queue.clear()
+    if not batch:
+        return True
+
+    delay = 1
+    attempts = 2 if final else ANALYTICS_MAX_RETRIES
+    for attempt in range(attempts):
+        try:
+            get_worksheet('Analytics', headers=ANALYTICS_HEADERS).append_rows(batch)
+            _analytics_state['written'] += len(batch)
+            return True
+        except Exception as e:
+            print(f'analytics flush error ({len(batch)} rows, attempt {attempt + 1}): {e}')
+            if attempt + 1 < attempts:
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    with _analytics_lock:
+        room = max(0, ANALYTICS_QUEUE_MAX - len(_analytics_queue))
+        keep = batch[-room:] if room else []
+        dropped = batch[:len(batch) - len(keep)]
+        _analytics_state['dropped'] += len(dropped)
+        _analytics_queue.extendleft(reversed(keep))
+    # Their counter bumps will never be matched by a sheet row
+    for row in dropped:
+        if row[2] in _COUNTER_EVENTS:
+            drop_pending(row[1], _COUNTER_EVENTS[row[2]])
+    return False
+
+
+def _analytics_writer():
+    while True:
+        _analytics_wakeup.wait(ANALYTICS_FLUSH_INTERVAL)
+        _analytics_wakeup.clear()
+        _flush_analytics()
+
+
+@atexit.register
+def _flush_analytics_on_exit():
+    if _analytics_queue:
+        _flush_analytics(final=True)
+
+
 @app.route('/api/v1/analytics', methods=['POST'])
 def log_analytics():
     body       = request.json or {}
@@ -491,19 +1658,11 @@ def log_analytics():
     prompt_id  = body.get('prompt_id', 'N/A')
     user_ip    = request.headers.get('X-Forwarded-For', request.remote_addr)
 
-    try:
-        client = get_google_client()
-        ss     = client.open_by_key(GOOGLE_SHEET_ID)
-        try:
-            sheet = ss.worksheet('Analytics')
-        except Exception:
-            sheet = ss.add_worksheet(title='Analytics', rows=10000, cols=6)
-            sheet.update('A1:F1', [['Timestamp', 'Prompt ID', 'Event Type',
-                                     'User IP', 'Error Message', 'Status']])
-        sheet.append_row([ts(), prompt_id, event_type, user_ip, '', 'success'])
-        return jsonify({'status': 'success'})
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    if not enqueue_analytics([ts(), prompt_id, event_type, user_ip, '', 'success']):
+        return jsonify({'status': 'error', 'message': 'Analytics queue is full'}), 503
+    if event_type in _COUNTER_EVENTS:
+        bump_counter(prompt_id, _COUNTER_EVENTS[event_type])
+    return jsonify({'status': 'queued'}), 202
 
 
 # ─────────────────────────────────────────────────────────────
@@ -550,31 +1709,47 @@ DEFAULT_FEATURE_FLAGS = {
 # In-memory cache of current flags (loaded from Google Sheets)
 _feature_flags_cache = None
 _feature_flags_last_load = 0
+_feature_flags_generation = None   # shared flags_generation the cache was loaded at
 FEATURE_FLAGS_CACHE_TTL = 60  # seconds
 
 
 def _get_feature_flags_sheet():
     """Get or create the 'FeatureFlags' worksheet."""
-    client = get_google_client()
-    ss = client.open_by_key(GOOGLE_SHEET_ID)
-    try:
-        sheet = ss.worksheet('FeatureFlags')
-    except gspread.exceptions.WorksheetNotFound:
-        sheet = ss.add_worksheet(title='FeatureFlags', rows=100, cols=4)
-        sheet.update('A1:D1', [['Flag Name', 'Enabled', 'Description', 'Updated At']])
-        # Seed defaults
-        for name, meta in DEFAULT_FEATURE_FLAGS.items():
-            sheet.append_row([name, 'TRUE', meta['description'], ts()])
-    return sheet
+    def seed_defaults(sheet):
+        sheet.append_rows([[name, 'TRUE', meta['description'], ts()]
+                           for name, meta in DEFAULT_FEATURE_FLAGS.items()])
+    return get_worksheet('FeatureFlags', headers=['Flag Name', 'Enabled', 'Description', 'Updated At'],
+                         rows=100, on_create=seed_defaults)
+
+
+def _flags_generation():
+    """Shared feature-flags generation, bumped by every save; None in per-process mode."""
+    row = _shared_call(lambda c: c.execute('SELECT flags_generation FROM meta WHERE id = 1').fetchone())
+    return row[0] if row else None
 
 
 def _load_feature_flags():
-    """Load feature flags from Google Sheets with in-memory caching."""
-    global _feature_flags_cache, _feature_flags_last_load
+    """Load feature flags from Google Sheets with in-memory caching.
+    A save on any worker bumps the shared flags generation, so every other
+    worker drops its cached copy on the next call instead of after the TTL."""
+    global _feature_flags_cache, _feature_flags_last_load, _feature_flags_generation
     now = time.time()
-    if _feature_flags_cache is not None and (now - _feature_flags_last_load < FEATURE_FLAGS_CACHE_TTL):
+    generation = _flags_generation()
+    current = generation is None or generation == _feature_flags_generation
+    if _feature_flags_cache is not None and current and (now - _feature_flags_last_load < FEATURE_FLAGS_CACHE_TTL):
+        metric_inc('vpg_cache_requests_total', cache='feature_flags', result='hit')
+        return _feature_flags_cache
+
+    # Another worker may have loaded (or saved) them recently
+    loaded_at, shared_flags = shared_get_blob('feature_flags')
+    if shared_flags is not None and now - loaded_at < FEATURE_FLAGS_CACHE_TTL:
+        metric_inc('vpg_cache_requests_total', cache='feature_flags', result='shared')
+        _feature_flags_cache, _feature_flags_last_load = shared_flags, loaded_at
+        _feature_flags_generation = generation
         return _feature_flags_cache
 
+    metric_inc('vpg_cache_requests_total', cache='feature_flags', result='miss')
+
     try:
         sheet = _get_feature_flags_sheet()
         records = sheet.get_all_records()
@@ -593,6 +1768,13 @@ def _load_feature_flags():
                 flags[name] = {'enabled': meta['enabled'], 'description': meta['description']}
         _feature_flags_cache = flags
         _feature_flags_last_load = now
+        _feature_flags_generation = generation
+        # Skip the publish if a save landed while the sheet was being read
+        data = json.dumps(flags, separators=(',', ':'))
+        _shared_call(lambda c: c.execute(
+            'INSERT OR REPLACE INTO blobs (name, updated_at, data) '
+            "SELECT 'feature_flags', ?, ? FROM meta WHERE id = 1 AND flags_generation = ?",
+            (now, data, generation)))
     except Exception as e:
         print(f'_load_feature_flags error: {e}')
         if _feature_flags_cache is None:
@@ -603,41 +1785,69 @@ def _load_feature_flags():
     return _feature_flags_cache
 
 
-def _save_feature_flag(flag_name, enabled):
-    """Persist a single flag to Google Sheets and bust the cache."""
-    global _feature_flags_cache, _feature_flags_last_load
-    sheet = _get_feature_flags_sheet()
-    records = sheet.get_all_records()
-    headers = sheet.row_values(1)
+def _save_feature_flags(changes):
+    """Persist {flag_name: bool, ...} to Google Sheets in one read and one write
+    (plus one append for flags not yet in the sheet), then refresh the cache."""
+    global _feature_flags_cache, _feature_flags_last_load, _feature_flags_generation
+    sheet  = _get_feature_flags_sheet()
+    values = sheet.get_all_values()
+    headers = values[0] if values else sheet_headers(sheet)
+    remember_sheet_headers(sheet, headers)
 
-    name_col    = headers.index('Flag Name') + 1
     enabled_col = headers.index('Enabled') + 1
     ts_col      = headers.index('Updated At') + 1
-
-    row_num = None
-    for i, row in enumerate(records, start=2):
-        if str(row.get('Flag Name', '')).strip() == flag_name:
-            row_num = i
-            break
-
-    enabled_str = 'TRUE' if enabled else 'FALSE'
-    if row_num:
-        sheet.update_cell(row_num, enabled_col, enabled_str)
-        sheet.update_cell(row_num, ts_col, ts())
-    else:
-        desc = DEFAULT_FEATURE_FLAGS.get(flag_name, {}).get('description', '')
-        sheet.append_row([flag_name, enabled_str, desc, ts()])
+    name_idx    = headers.index('Flag Name')
+    rows = {}
+    for i, row in enumerate(values[1:], start=2):
+        name = row[name_idx].strip() if len(row) > name_idx else ''
+        if name and name not in rows:
+            rows[name] = i
+
+    now = ts()
+    cells, new_rows = [], []
+    for flag_name, enabled in changes.items():
+        enabled_str = 'TRUE' if enabled else 'FALSE'
+        if flag_name in rows:
+            cells += [(rows[flag_name], enabled_col, enabled_str), (rows[flag_name], ts_col, now)]
+        else:
+            desc = DEFAULT_FEATURE_FLAGS.get(flag_name, {}).get('description', '')
+            new_rows.append([flag_name, enabled_str, desc, now])
+    batch_write_cells(sheet, cells)
+    if new_rows:
+        sheet.append_rows(new_rows)
 
     # Update in-memory cache immediately
     if _feature_flags_cache is not None:
-        if flag_name in _feature_flags_cache:
-            _feature_flags_cache[flag_name]['enabled'] = enabled
-        else:
-            _feature_flags_cache[flag_name] = {
-                'enabled': enabled,
-                'description': DEFAULT_FEATURE_FLAGS.get(flag_name, {}).get('description', ''),
-            }
-    _feature_flags_last_load = time.time()
+        for flag_name, enabled in changes.items():
+            if flag_name in _feature_flags_cache:
+                _feature_flags_cache[flag_name]['enabled'] = enabled
+            else:
+                _feature_flags_cache[flag_name] = {
+                    'enabled': enabled,
+                    'description': DEFAULT_FEATURE_FLAGS.get(flag_name, {}).get('description', ''),
+                }
+    saved_at = time.time()
+    flags = _feature_flags_cache
+
+    def publish(conn):
+        # New generation and the flags it names land together; without a local
+        # copy to publish, other workers fall back to reading the sheet
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('UPDATE meta SET flags_generation = flags_generation + 1 WHERE id = 1')
+            if flags is not None:
+                conn.execute('INSERT OR REPLACE INTO blobs (name, updated_at, data) VALUES (?, ?, ?)',
+                             ('feature_flags', saved_at, json.dumps(flags, separators=(',', ':'))))
+            else:
+                conn.execute("DELETE FROM blobs WHERE name = 'feature_flags'")
+            generation = conn.execute('SELECT flags_generation FROM meta WHERE id = 1').fetchone()[0]
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return generation
+    _feature_flags_generation = _shared_call(publish)
+    _feature_flags_last_load = saved_at
 
 
 @app.route('/api/v1/feature-flags')
@@ -665,17 +1875,21 @@ def admin_save_feature_flags():
         return jsonify({'status': 'error', 'message': 'Expected a JSON object'}), 400
 
     known_flags = set(DEFAULT_FEATURE_FLAGS.keys()) | set((_load_feature_flags() or {}).keys())
-    updated = []
+    changes = {}
     for flag_name, enabled in body.items():
         if flag_name not in known_flags:
             continue  # ignore unknown flags silently
         if not isinstance(enabled, bool):
             continue
+        changes[flag_name] = enabled
+
+    updated = []
+    if changes:
         try:
-            _save_feature_flag(flag_name, enabled)
-            updated.append(flag_name)
+            _save_feature_flags(changes)
+            updated = list(changes)
         except Exception as e:
-            print(f'save_feature_flag({flag_name}) error: {e}')
+            print(f'save_feature_flags({", ".join(changes)}) error: {e}')
 
     return jsonify({'status': 'success', 'updated': updated})
 
@@ -684,6 +1898,32 @@ def admin_save_feature_flags():
 # API — Admin Prompt CRUD  (protected)
 # ─────────────────────────────────────────────────────────────
 
+# Responsive renditions of Cloudinary-hosted prompt images. They are plain URL
+# transformations, so they're derived from the stored secure_url rather than
+# kept in the sheet; uploads pre-generate them as eager transformations.
+RENDITION_WIDTHS  = (320, 480, 768, 1080)
+RENDITION_FORMATS = ('avif', 'webp')
+RENDITION_PLACEHOLDER = 'c_limit,e_blur:200,f_webp,q_auto:low,w_32'
+
+
+def _rendition_transforms():
+    return [f'c_limit,f_{fmt},q_auto,w_{w}' for fmt in RENDITION_FORMATS for w in RENDITION_WIDTHS] \
+        + [RENDITION_PLACEHOLDER]
+
+
+def image_renditions(url):
+    """srcset strings per format plus a blur placeholder URL, or None when the
+    image isn't hosted on Cloudinary."""
+    if not url or 'res.cloudinary.com/' not in url or '/image/upload/' not in url:
+        return None
+    base, path = url.split('/image/upload/', 1)
+    prefix = f'{base}/image/upload/'
+    out = {fmt: ', '.join(f'{prefix}c_limit,f_{fmt},q_auto,w_{w}/{path} {w}w' for w in RENDITION_WIDTHS)
+           for fmt in RENDITION_FORMATS}
+    out['placeholder'] = f'{prefix}{RENDITION_PLACEHOLDER}/{path}'
+    return out
+
+
 @app.route('/api/v1/admin/upload-image', methods=['POST'])
 @admin_required
 def upload_image():
@@ -708,20 +1948,59 @@ def upload_image():
             resource_type='image',
             overwrite=False,
             unique_filename=True,
+            # Build the grid renditions now so the first visitor doesn't wait on them
+            eager=_rendition_transforms(),
+            eager_async=True,
         )
         permanent_url = result.get('secure_url', '')
         if not permanent_url:
             raise ValueError('Cloudinary returned no URL')
-        return jsonify({'status': 'success', 'url': permanent_url})
+        return jsonify({'status': 'success', 'url': permanent_url,
+                        'renditions': image_renditions(permanent_url)})
     except Exception as e:
         print(f'[Cloudinary upload error] {e}')
         return jsonify({'status': 'error', 'message': f'Upload failed: {str(e)}'}), 500
 
 
-def _generate_id():
-    """Generate a unique prompt ID like PR2104151003."""
+# Prompt IDs are PR + yymmddHHMMSS + milliseconds, drawn from a counter that
+# never goes backwards. The counter lives in the shared store so gunicorn
+# workers creating prompts in the same millisecond still get distinct IDs.
+_prompt_id_state = {'last': 0}
+_prompt_id_lock = threading.Lock()
+
+
+def _generate_ids(n=1):
+    """Allocate n unique, increasing prompt IDs like PR260417093012345."""
     now = datetime.now(INDIA_TZ)
-    return f"PR{now.strftime('%y%m%d%H%M%S')}"
+    floor = int(now.strftime('%y%m%d%H%M%S')) * 1000 + now.microsecond // 1000
+
+    def reserve(conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute("SELECT data FROM blobs WHERE name = 'last_prompt_id'").fetchone()
+            start = max(floor, (json.loads(row[0]) if row else 0) + 1)
+            conn.execute('INSERT OR REPLACE INTO blobs (name, updated_at, data) VALUES (?, ?, ?)',
+                         ('last_prompt_id', time.time(), json.dumps(start + n - 1)))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return start
+
+    with _prompt_id_lock:
+        start = max(_shared_call(reserve, default=0), floor, _prompt_id_state['last'] + 1)
+        _prompt_id_state['last'] = start + n - 1
+    return [f'PR{start + i}' for i in range(n)]
+
+
+def _generate_id():
+    """Generate a unique prompt ID like PR260417093012345."""
+    return _generate_ids(1)[0]
+
+
+def _prompt_row(headers, values):
+    """A sheet row (ordered like headers) from {header: value}; unknown headers stay blank."""
+    return [values.get(h, '') for h in headers]
 
 
 @app.route('/api/v1/admin/prompt', methods=['POST'])
@@ -740,60 +2019,47 @@ def create_prompt():
         return jsonify({'status': 'error', 'message': 'Name and Prompt are required'}), 400
 
     try:
-        client   = get_google_client()
-        ss       = client.open_by_key(GOOGLE_SHEET_ID)
-        sheet    = ss.sheet1
-        
-        # Determine column order dynamically
-        headers = sheet.row_values(1)
-        
-        # Ensure 'Image URL' and 'AI Tool' columns exist dynamically
-        added_cols = False
-        if 'Image URL' not in headers:
-            headers.append('Image URL')
-            added_cols = True
-        if 'AI Tool' not in headers:
-            headers.append('AI Tool')
-            added_cols = True
-            
-        if added_cols:
-            sheet.update('A1', [headers])
-
-        # Required columns: Category, Prompt, Prompt Name, Timestamp, Unique ID
-        def get_idx(name):
-            try: return headers.index(name)
-            except: return -1
-
-        cat_idx   = get_idx('Category')
-        prompt_idx = get_idx('Prompt')
-        name_idx   = get_idx('Prompt Name')
-        ts_idx     = get_idx('Timestamp')
-        id_idx     = get_idx('Unique ID')
-        vid_idx    = get_idx('Video ID')
-        tool_idx   = get_idx('AI Tool')
-        img_idx    = get_idx('Image URL')
-
-        new_id    = _generate_id()
-        timestamp = ts()
+        sheet    = get_worksheet()
 
-        # Build a row of the same length as headers
-        row_data = [""] * len(headers)
-        if cat_idx != -1:    row_data[cat_idx]    = category
-        if prompt_idx != -1: row_data[prompt_idx] = prompt
-        if name_idx != -1:   row_data[name_idx]   = name
-        if ts_idx != -1:     row_data[ts_idx]     = timestamp
-        if id_idx != -1:     row_data[id_idx]     = new_id
-        if vid_idx != -1:    row_data[vid_idx]    = video_id
-        if tool_idx != -1:   row_data[tool_idx]   = ai_tool
-        if img_idx != -1:    row_data[img_idx]    = image_url
+        # Determine column order dynamically, ensuring 'Image URL' and 'AI Tool' exist
+        headers = ensure_sheet_columns(sheet, ['Image URL', 'AI Tool'])
+
+        new_id = _generate_id()
+        row_data = _prompt_row(headers, {
+            'Category': category, 'Prompt': prompt, 'Prompt Name': name, 'Timestamp': ts(),
+            'Unique ID': new_id, 'Video ID': video_id, 'AI Tool': ai_tool, 'Image URL': image_url,
+        })
 
         sheet.append_row(row_data)
+        write_through_prompts(lambda prompts: prompts + [_to_record(headers, row_data)])
         invalidate_cache()
         return jsonify({'status': 'success', 'id': new_id})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+# Prompt ID → sheet row, derived from the current snapshot (records are in
+# sheet order, starting at row 2) and rebuilt when the generation changes.
+_prompt_rows = {'current': (None, {})}
+
+
+def _find_prompt_row(sheet, prompt_id, id_col):
+    """Sheet row holding prompt_id, or None. The snapshot's row is confirmed with
+    a single cell read; if rows have shifted since, the ID column is re-read."""
+    generation, rows = _prompt_rows['current']
+    if generation != cache['generation']:
+        generation = cache['generation']
+        rows = {str(p.get('Unique ID', '')): i for i, p in enumerate(cache['prompts'] or [], start=2)}
+        _prompt_rows['current'] = (generation, rows)
+    row_num = rows.get(prompt_id)
+    if row_num and str(sheet.cell(row_num, id_col).value or '').strip() == prompt_id:
+        return row_num
+    for i, value in enumerate(sheet.col_values(id_col)[1:], start=2):
+        if str(value).strip() == prompt_id:
+            return i
+    return None
+
+
 @app.route('/api/v1/admin/prompt/<prompt_id>', methods=['PUT'])
 @admin_required
 def update_prompt(prompt_id):
@@ -810,64 +2076,434 @@ def update_prompt(prompt_id):
         return jsonify({'status': 'error', 'message': 'Name and Prompt are required'}), 400
 
     try:
-        client = get_google_client()
-        ss     = client.open_by_key(GOOGLE_SHEET_ID)
-        sheet  = ss.sheet1
-        data   = sheet.get_all_records()
-        headers = sheet.row_values(1)
-
+        sheet   = get_worksheet()
         # Ensure dynamic columns exist
-        added_cols = False
-        if 'Image URL' not in headers:
-            headers.append('Image URL')
-            added_cols = True
-        if 'AI Tool' not in headers:
-            headers.append('AI Tool')
-            added_cols = True
-            
-        if added_cols:
-            sheet.update('A1', [headers])
-
-        id_col     = headers.index('Unique ID') + 1
-        name_col   = headers.index('Prompt Name') + 1
-        cat_col    = headers.index('Category') + 1
-        prompt_col = headers.index('Prompt') + 1
-        vid_col    = (headers.index('Video ID') + 1) if 'Video ID' in headers else None
-        tool_col   = (headers.index('AI Tool') + 1) if 'AI Tool' in headers else None
-        img_col    = (headers.index('Image URL') + 1) if 'Image URL' in headers else None
-
-        row_num = None
-        for i, row in enumerate(data, start=2):
-            if row.get('Unique ID') == prompt_id:
-                row_num = i
-                break
+        headers = ensure_sheet_columns(sheet, ['Image URL', 'AI Tool'])
+        col     = lambda name: headers.index(name) + 1
 
+        row_num = _find_prompt_row(sheet, prompt_id, col('Unique ID'))
         if row_num is None:
             return jsonify({'status': 'error', 'message': 'Prompt not found'}), 404
 
-        sheet.update_cell(row_num, name_col,   name)
-        sheet.update_cell(row_num, cat_col,    category)
-        sheet.update_cell(row_num, prompt_col, prompt)
-        if vid_col and video_id:
-            sheet.update_cell(row_num, vid_col, video_id)
-        if tool_col and ai_tool:
-            sheet.update_cell(row_num, tool_col, ai_tool)
-        if img_col is not None:
-            sheet.update_cell(row_num, img_col, image_url)
-
+        cells = [
+            (row_num, col('Prompt Name'), name),
+            (row_num, col('Category'),    category),
+            (row_num, col('Prompt'),      prompt),
+            (row_num, col('Image URL'),   image_url),
+        ]
+        if 'Video ID' in headers and video_id:
+            cells.append((row_num, col('Video ID'), video_id))
+        if ai_tool:
+            cells.append((row_num, col('AI Tool'), ai_tool))
+        batch_write_cells(sheet, cells)
+
+        changed = [headers[c - 1] for _, c, _ in cells]
+        record = _to_record(changed, [value for _, _, value in cells])
+        write_through_prompts(lambda prompts: [dict(p, **record) if str(p.get('Unique ID', '')) == prompt_id else p
+                                               for p in prompts])
         invalidate_cache()
         return jsonify({'status': 'success'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+# ─────────────────────────────────────────────────────────────
+# API — Admin bulk import / export  (protected)
+# ─────────────────────────────────────────────────────────────
+IMPORT_MAX_ROWS = 5000
+# Import accepts the editor's field names or the sheet's own headers, so an
+# export can be fed straight back in.
+IMPORT_FIELDS = {
+    'name': 'Prompt Name', 'category': 'Category', 'prompt': 'Prompt',
+    'video_id': 'Video ID', 'ai_tool': 'AI Tool', 'image_url': 'Image URL',
+}
+
+
+def _parse_import_body():
+    """Returns a list of dicts from a CSV, JSON or NDJSON request body."""
+    fmt = (request.args.get('format') or request.mimetype or '').lower()
+    text = request.get_data(as_text=True)
+    if 'csv' in fmt:
+        return list(csv.DictReader(io.StringIO(text)))
+    if 'ndjson' in fmt or 'jsonl' in fmt:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    data = json.loads(text or 'null')
+    if isinstance(data, dict):
+        data = data.get('prompts')
+    if not isinstance(data, list):
+        raise ValueError('Expected a list of prompts')
+    return data
+
+
+def _import_record(item):
+    """Normalise one import row to {sheet header: value}, or raise ValueError."""
+    if not isinstance(item, dict):
+        raise ValueError('not an object')
+    values = {}
+    for field, header in IMPORT_FIELDS.items():
+        raw = item.get(field, item.get(header, ''))
+        values[header] = str(raw if raw is not None else '').strip()
+    if not values['Prompt Name'] or not values['Prompt']:
+        raise ValueError('Name and Prompt are required')
+    values['AI Tool'] = values['AI Tool'] or 'Gemini'
+    return values
+
+
+@app.route('/api/v1/admin/prompts/import', methods=['POST'])
+@admin_required
+def import_prompts():
+    """Bulk-create prompts from CSV, JSON or NDJSON (?format= or Content-Type).
+    All rows are validated first; nothing is written unless every row is valid,
+    and the batch goes to the sheet in a single append_rows call."""
+    try:
+        items = _parse_import_body()
+    except (ValueError, csv.Error) as e:
+        return jsonify({'status': 'error', 'message': f'Could not parse import: {e}'}), 400
+    if not items:
+        return jsonify({'status': 'error', 'message': 'No prompts to import'}), 400
+    if len(items) > IMPORT_MAX_ROWS:
+        return jsonify({'status': 'error', 'message': f'At most {IMPORT_MAX_ROWS} prompts per import'}), 413
+
+    records, errors = [], []
+    for n, item in enumerate(items, start=1):
+        try:
+            records.append(_import_record(item))
+        except ValueError as e:
+            errors.append({'row': n, 'message': str(e)})
+    if errors:
+        return jsonify({'status': 'error', 'message': f'{len(errors)} invalid row(s)', 'errors': errors[:50]}), 400
+
+    try:
+        sheet   = get_worksheet()
+        headers = ensure_sheet_columns(sheet, ['Image URL', 'AI Tool'])
+        ids     = _generate_ids(len(records))
+        timestamp = ts()
+        rows = [_prompt_row(headers, dict(rec, **{'Unique ID': pid, 'Timestamp': timestamp}))
+                for pid, rec in zip(ids, records)]
+        sheet.append_rows(rows)
+        write_through_prompts(lambda prompts: prompts + [_to_record(headers, row) for row in rows])
+        invalidate_cache()
+        return jsonify({'status': 'success', 'created': len(ids), 'ids': ids})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@app.route('/api/v1/admin/prompts/export')
+@admin_required
+def export_prompts():
+    """Stream the whole prompt table as CSV (default) or NDJSON (?format=ndjson)."""
+    prompts = list(fetch_data().get('prompts') or [])
+    fmt = (request.args.get('format') or 'csv').lower()
+
+    if fmt == 'ndjson':
+        def generate():
+            for p in prompts:
+                yield json.dumps(p, ensure_ascii=False) + '\n'
+        mimetype, ext = 'application/x-ndjson', 'ndjson'
+    else:
+        headers = list(dict.fromkeys(k for p in prompts for k in p))
+
+        def generate():
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(headers)
+            for p in prompts:
+                writer.writerow([p.get(h, '') for h in headers])
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+            yield buf.getvalue()
+        mimetype, ext = 'text/csv', 'csv'
+
+    return Response(generate(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="prompts-{datetime.now(INDIA_TZ):%Y%m%d}.{ext}"',
+        'Cache-Control': 'no-store',
+    })
+
+
+# ─────────────────────────────────────────────────────────────
+# API — Snapshot export  (NDJSON stream for offline builders)
+# One JSON object per line: a "meta" header, one line per item (prompt, count,
+# image rendition set, approved comment), then an "end" trailer carrying the
+# cursor for the next call. With ?since=<cursor> only items that changed since
+# that export are sent, plus {"deleted": true} lines for removed ones; an
+# unknown or expired cursor gets a full export flagged "full": true.
+# Cursors are content hashes of the view, so every worker computing the same
+# view hands out the same one. For the builders' default view the item digests
+# behind a cursor live in the shared store for EXPORT_CURSOR_TTL; cursors of
+# other filter combinations are only remembered by this process's view cache,
+# so arbitrary query strings can't grow the store.
+# ─────────────────────────────────────────────────────────────
+EXPORT_SECTIONS       = ('prompts', 'counts', 'images', 'comments')
+EXPORT_DEFAULT        = ('prompts', 'counts', 'images')
+EXPORT_METRICS        = ('likes', 'comments')
+EXPORT_CURSOR_TTL     = 7 * 86400   # seconds a cursor stays usable for deltas
+EXPORT_VIEW_CACHE     = 4           # serialized views kept per process
+
+# The only view whose cursors are persisted in the shared store
+EXPORT_SHARED_SPEC    = (EXPORT_DEFAULT, None, EXPORT_METRICS)
+
+_export_views = OrderedDict()   # (generation, counters version, spec) -> view
+_export_views_lock = threading.Lock()
+
+
+def _export_spec():
+    """(sections, prompt fields or None for all, count metrics) from the query string."""
+    def listarg(name, allowed=None, default=()):
+        raw = request.args.get(name)
+        if raw is None:
+            return tuple(default)
+        values = tuple(dict.fromkeys(v.strip() for v in raw.split(',') if v.strip()))
+        unknown = [v for v in values if allowed is not None and v not in allowed]
+        if unknown:
+            raise ValueError(f'Unknown {name}: {", ".join(unknown)}')
+        return values
+    sections = listarg('sections', EXPORT_SECTIONS, EXPORT_DEFAULT)
+    fields   = listarg('fields') or None
+    metrics  = listarg('counts', EXPORT_METRICS, EXPORT_METRICS)
+    return sections, fields, metrics
+
+
+def _export_items(sections, fields, metrics):
+    """Yields (item key, line object) for the current snapshot, in sheet order."""
+    prompts = cache['prompts'] or []
+    if 'prompts' in sections:
+        for p in prompts:
+            pid = str(p.get('Unique ID', ''))
+            if pid:
+                data = p if fields is None else {k: p[k] for k in ('Unique ID',) + fields if k in p}
+                yield f'prompt:{pid}', {'type': 'prompt', 'id': pid, 'data': data}
+    if 'counts' in sections:
+        for pid, c in public_counts().items():
+            values = {m: c[m] for m in metrics}
+            if any(values.values()):
+                yield f'count:{pid}', dict({'type': 'count', 'id': pid}, **values)
+    if 'images' in sections:
+        for p in prompts:
+            pid = str(p.get('Unique ID', ''))
+            renditions = image_renditions(p.get('Image URL', ''))
+            if pid and renditions:
+                yield f'image:{pid}', {'type': 'image', 'id': pid, 'data': renditions}
+    if 'comments' in sections:
+        for data in cache['comments'] or []:
+            cid = hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+            yield f'comment:{cid}', {'type': 'comment', 'id': cid, 'data': data}
+
+
+def _export_view(spec):
+    """Serialized lines, per-item digests and cursor for spec; built once per
+    snapshot/counter change."""
+    key = (cache['generation'], _counters_state['version'], spec)
+    with _export_views_lock:
+        view = _export_views.get(key)
+        if view:
+            _export_views.move_to_end(key)
+            return view
+    lines, digests = {}, {}
+    for item_key, obj in _export_items(*spec):
+        line = json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+        lines[item_key] = line
+        digests[item_key] = hashlib.sha256(line.encode('utf-8')).hexdigest()[:16]
+    cursor = hashlib.sha256(json.dumps([spec, digests], separators=(',', ':')).encode('utf-8')).hexdigest()[:32]
+    view = {'cursor': cursor, 'lines': lines, 'digests': digests}
+
+    name = f'export:{cursor}'
+    if spec == EXPORT_SHARED_SPEC and \
+            not _shared_call(lambda c: c.execute('SELECT 1 FROM blobs WHERE name = ?', (name,)).fetchone()):
+        shared_put_blob(name, digests)
+        _shared_call(lambda c: c.execute("DELETE FROM blobs WHERE name LIKE 'export:%' AND updated_at < ?",
+                                         (time.time() - EXPORT_CURSOR_TTL,)))
+    with _export_views_lock:
+        _export_views[key] = view
+        while len(_export_views) > EXPORT_VIEW_CACHE:
+            _export_views.popitem(last=False)
+    return view
+
+
+def _export_cursor_digests(cursor, spec):
+    """Item digests behind an earlier cursor, or None if it is unknown/expired."""
+    with _export_views_lock:
+        for view in _export_views.values():
+            if view['cursor'] == cursor:
+                return view['digests']
+    if spec != EXPORT_SHARED_SPEC:
+        return None
+    updated_at, digests = shared_get_blob(f'export:{cursor}')
+    if digests is None or time.time() - updated_at > EXPORT_CURSOR_TTL:
+        return None
+    return digests
+
+
+@app.route('/api/v1/export')
+def export_snapshot():
+    """Stream the public snapshot as NDJSON.
+    ?sections=prompts,counts,images,comments  ?fields=<prompt columns>
+    ?counts=likes,comments  ?since=<cursor from a previous export>"""
+    try:
+        spec = _export_spec()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    fetch_data()
+    view = _export_view(spec)
+    since = (request.args.get('since') or '').strip()
+    previous = _export_cursor_digests(since, spec) if since else None
+    full = previous is None
+    meta = {'type': 'meta', 'generation': cache['generation'], 'full': full,
+            'since': None if full else since, 'sections': list(spec[0])}
+
+    def generate():
+        yield json.dumps(meta) + '\n'
+        sent = 0
+        for item_key, line in view['lines'].items():
+            if full or previous.get(item_key) != view['digests'][item_key]:
+                sent += 1
+                yield line + '\n'
+        if not full:
+            for item_key in sorted(previous.keys() - view['lines'].keys()):
+                kind, _, item_id = item_key.partition(':')
+                sent += 1
+                yield json.dumps({'type': kind, 'id': item_id, 'deleted': True}) + '\n'
+        yield json.dumps({'type': 'end', 'cursor': view['cursor'], 'items': sent}) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-store',
+        'X-Export-Cursor': view['cursor'],
+    })
+
+
+# ─────────────────────────────────────────────────────────────
+# IMAGE GENERATION JOBS
+# Generation runs on a small bounded thread pool so slow provider calls never
+# hold a request worker. Job state lives in the shared store, so any gunicorn
+# worker can answer a poll; without it, jobs are tracked per process.
+# ─────────────────────────────────────────────────────────────
+IMAGE_JOB_WORKERS   = int(os.getenv('IMAGE_JOB_WORKERS', '4'))    # concurrent generations per process
+IMAGE_JOB_MAX_QUEUE = int(os.getenv('IMAGE_JOB_MAX_QUEUE', '20'))  # queued + running jobs per host
+IMAGE_JOB_PER_USER  = int(os.getenv('IMAGE_JOB_PER_USER', '2'))    # queued + running jobs per user
+IMAGE_JOB_TIMEOUT   = 300   # a job still unfinished after this is reported as failed
+IMAGE_JOB_TTL       = 900   # finished jobs stay pollable this long
+
+_image_jobs      = {}       # per-process fallback store: id -> job dict
+_image_jobs_lock = threading.Lock()
+_image_pool      = {'executor': None, 'pid': None}
+
+
+def _job_executor():
+    # Created lazily (and re-created after fork) so every worker owns its threads
+    with _image_jobs_lock:
+        if _image_pool['executor'] is None or _image_pool['pid'] != os.getpid():
+            _image_pool['executor'] = ThreadPoolExecutor(max_workers=IMAGE_JOB_WORKERS,
+                                                         thread_name_prefix='image-job')
+            _image_pool['pid'] = os.getpid()
+        return _image_pool['executor']
+
+
+def _reserve_image_job(job):
+    """Insert a queued job unless the user or host is at capacity. Returns an error message or None."""
+    now = job['created']
+    live_after = now - IMAGE_JOB_TIMEOUT
+
+    def check(active, mine):
+        if mine >= IMAGE_JOB_PER_USER:
+            return f'You already have {mine} image(s) generating. Please wait for them to finish.'
+        if active >= IMAGE_JOB_MAX_QUEUE:
+            return 'Image generation is busy right now. Please try again in a minute.'
+        return None
+
+    def reserve(conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM jobs WHERE updated < ?', (now - IMAGE_JOB_TTL,))
+            active, mine = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(owner = ?), 0) FROM jobs "
+                "WHERE state IN ('queued', 'running') AND created > ?", (job['owner'], live_after)).fetchone()
+            error = check(active, mine)
+            if not error:
+                conn.execute('INSERT INTO jobs (id, owner, state, created, updated, http_status, result) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (job['id'], job['owner'], job['state'], now, now, 202, None))
+            conn.execute('COMMIT')
+            return error or ''
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    result = _shared_call(reserve)
+    if result is not None:
+        return result or None
+
+    with _image_jobs_lock:
+        for job_id, j in list(_image_jobs.items()):
+            if j['updated'] < now - IMAGE_JOB_TTL:
+                del _image_jobs[job_id]
+        live = [j for j in _image_jobs.values()
+                if j['state'] in ('queued', 'running') and j['created'] > live_after]
+        error = check(len(live), sum(1 for j in live if j['owner'] == job['owner']))
+        if not error:
+            _image_jobs[job['id']] = dict(job, updated=now, http_status=202, result=None)
+        return error
+
+
+def _update_image_job(job_id, state, result=None, http_status=202):
+    now = time.time()
+    data = json.dumps(result) if result is not None else None
+    stored = _shared_call(lambda c: c.execute(
+        'UPDATE jobs SET state = ?, updated = ?, http_status = ?, result = ? WHERE id = ?',
+        (state, now, http_status, data, job_id)).rowcount)
+    if stored:
+        return
+    with _image_jobs_lock:
+        job = _image_jobs.get(job_id)
+        if job:
+            job.update(state=state, updated=now, http_status=http_status, result=result)
+
+
+def get_image_job(job_id):
+    """Returns {'owner', 'state', 'result', 'http_status'} or None."""
+    row = _shared_call(lambda c: c.execute(
+        'SELECT owner, state, created, http_status, result FROM jobs WHERE id = ?', (job_id,)).fetchone())
+    if row:
+        job = {'owner': row[0], 'state': row[1], 'created': row[2], 'http_status': row[3],
+               'result': json.loads(row[4]) if row[4] else None}
+    else:
+        with _image_jobs_lock:
+            job = dict(_image_jobs[job_id]) if job_id in _image_jobs else None
+    if job and job['state'] in ('queued', 'running') and time.time() - job['created'] > IMAGE_JOB_TIMEOUT:
+        # The worker that owned it died or hung
+        job.update(state='error', http_status=504,
+                   result={'status': 'error', 'message': 'Image generation timed out. Please try again.'})
+    return job
+
+
+def _run_image_job(job_id, fn, args):
+    _update_image_job(job_id, 'running')
+    started = time.perf_counter()
+    try:
+        result, http_status = fn(*args)
+    except Exception as e:
+        print(f'image job {job_id} error: {e}')
+        result, http_status = {'status': 'error', 'message': f'Image generation failed. Details: {e}'}, 500
+    metric_observe('vpg_image_job_seconds', time.perf_counter() - started,
+                   outcome='ok' if http_status == 200 else 'error')
+    _update_image_job(job_id, 'done' if http_status == 200 else 'error', result, http_status)
+
+
+def submit_image_job(owner, fn, *args):
+    """Queue fn(*args) -> (response_dict, http_status). Returns (job_id, None) or (None, error)."""
+    job = {'id': secrets.token_urlsafe(12), 'owner': owner, 'state': 'queued', 'created': time.time()}
+    error = _reserve_image_job(job)
+    if error:
+        return None, error
+    _job_executor().submit(_run_image_job, job['id'], fn, args)
+    return job['id'], None
+
+
 # ─────────────────────────────────────────────────────────────
 # AI IMAGE GENERATION
 # ─────────────────────────────────────────────────────────────
 @app.route('/api/v1/debug/models')
 def list_available_models():
     """Lists Gemini models available to this API key — for diagnostics."""
-    import urllib.request, json
     if not GEMINI_API_KEY:
         return jsonify({'error': 'No API key configured'}), 500
     try:
@@ -881,15 +2517,23 @@ def list_available_models():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/v1/admin/provider-stats')
+@admin_required
+def admin_provider_stats():
+    """Per-provider EWMA latency / error rate and the order they'd be tried in now."""
+    order = [name for name, _ in order_providers([(f'Gemini/{m}', None) for m in GEMINI_IMAGE_MODELS])]
+    return jsonify({'strategy': IMAGE_PROVIDER_STRATEGY, 'hedge_delay': IMAGE_HEDGE_DELAY,
+                    'gemini_order': order, 'providers': provider_stats()})
+
+
 @app.route('/api/v1/generate-image', methods=['POST'])
 def generate_image_api():
     """Generates an image from prompt + optional reference image using Gemini (primary)
     and OpenAI DALL-E 3 (fallback). When a reference image is uploaded the model
     performs image-editing — keeping the subject’s appearance while changing the scene.
     Requires user login — uses the user's own Gemini API key.
+    The work is queued as a job; poll /api/v1/generate-image/<job_id> for the result.
     """
-    import urllib.request, urllib.error, urllib.parse, json
-
     # ── AUTH CHECK ─────────────────────────────────────────────
     is_admin = session.get('admin_logged_in')
     user_email = session.get('user_email')
@@ -929,12 +2573,394 @@ def generate_image_api():
             if 'image/' in header:
                 ref_mime = header.split(':')[1].split(';')[0]
 
+    try:
+        ref_bytes = base64.b64decode(ref_b64, validate=True) if ref_b64 else b''
+    except (ValueError, TypeError):
+        return jsonify({'status': 'error', 'message': 'Reference image is not valid base64.'}), 400
+
+    # Identical request already generated: answer from the cache, no provider call
+    cache_key = image_cache_key(prompt, ref_bytes, aspect_ratio)
+    hit = image_cache_get(cache_key)
+    if hit:
+        filename, mime = hit
+        return jsonify({'status': 'success', 'cached': True, 'mime_type': mime,
+                        'image_url': generated_image_url(filename)})
+
+    # Provider calls can take minutes, so they run on the job pool instead of
+    # tying up this request worker; the client polls the returned job ID.
+    owner = 'admin' if is_admin else user_email
+    job_id, error = submit_image_job(owner, _generate_image,
+                                     user_gemini_key, prompt, ref_mime, ref_bytes, aspect_ratio, cache_key)
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 429
+    return jsonify({'status': 'queued', 'job_id': job_id}), 202
+
+
+@app.route('/api/v1/generate-image/<job_id>')
+def generate_image_status(job_id):
+    """Poll a generation job. Returns the job state, or the final result once finished."""
+    owner = 'admin' if session.get('admin_logged_in') else session.get('user_email')
+    if not owner:
+        return jsonify({'status': 'error', 'message': 'LOGIN_REQUIRED'}), 401
+    job = get_image_job(job_id)
+    if not job or job['owner'] != owner:
+        return jsonify({'status': 'error', 'message': 'Job not found or expired.'}), 404
+    if job['state'] in ('queued', 'running'):
+        return jsonify({'status': job['state'], 'job_id': job_id}), 202
+    return jsonify(job['result']), job['http_status']
+
+
+_GENERATED_NAME_RE = re.compile(r'^[0-9a-f]{64}\.(png|jpg|webp)$')
+
+@app.route('/api/v1/generated/<name>')
+def generated_image(name):
+    """Serves a generated image as binary. Names are the sha256 of the file's
+    bytes, so the response never changes and browsers may cache it indefinitely."""
+    if not _GENERATED_NAME_RE.match(name):
+        return jsonify({'status': 'error', 'message': 'Not found'}), 404
+    response = send_from_directory(IMAGE_CACHE_DIR, name, max_age=31536000, etag=name.split('.')[0])
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+# ─────────────────────────────────────────────────────────────
+# GENERATED IMAGE CACHE
+# Image files are named by the sha256 of their bytes, so a URL always serves
+# the same content. A small "<request key>.ref" pointer per (prompt, reference
+# image bytes, aspect ratio) names the file an identical request produced, so a
+# repeat is served from disk without touching any provider. Files are evicted
+# least-recently-used past IMAGE_CACHE_MAX_BYTES and when unused for
+# IMAGE_CACHE_TTL.
+# ─────────────────────────────────────────────────────────────
+IMAGE_CACHE_DIR       = os.getenv('IMAGE_CACHE_DIR', host_state_path('vpg_image_cache'))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(500 * 1024 * 1024)))
+IMAGE_CACHE_TTL       = int(os.getenv('IMAGE_CACHE_TTL', str(7 * 24 * 3600)))
+IMAGE_CACHE_EXTS      = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/webp': 'webp'}
+VISION_MEMO_SIZE      = 256
+
+_vision_memo = OrderedDict()   # preprocessed reference sha256 -> subject description
+_vision_memo_lock = threading.Lock()
+
+
+def image_cache_key(prompt, ref_bytes, aspect_ratio):
+    ref_hash = hashlib.sha256(ref_bytes).hexdigest() if ref_bytes else ''
+    return hashlib.sha256(f'{prompt}\0{ref_hash}\0{aspect_ratio}'.encode()).hexdigest()
+
+
+def _atomic_write(path, data):
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)   # atomic, so concurrent readers never see a partial file
+
+
+def image_cache_get(key):
+    """Returns (filename, mime) or None. A hit refreshes the entry's LRU position."""
+    ref = os.path.join(IMAGE_CACHE_DIR, f'{key}.ref')
+    try:
+        with open(ref) as f:
+            filename = f.read().strip()
+        path = os.path.join(IMAGE_CACHE_DIR, filename)
+        if not _GENERATED_NAME_RE.match(filename) or time.time() - os.path.getmtime(path) > IMAGE_CACHE_TTL:
+            os.remove(ref)
+            return None
+        os.utime(path)
+        os.utime(ref)
+    except FileNotFoundError:
+        # Never stored, or the image was evicted from under its pointer
+        try:
+            os.remove(ref)
+        except OSError:
+            pass
+        return None
+    except OSError:
+        return None
+    return filename, mimetypes.guess_type(path)[0] or 'image/png'
+
+
+def image_cache_put(key, data, mime):
+    """Stores the image bytes under their content hash and, when key is given,
+    points key at them. Returns the cache filename, or None if the write failed."""
+    filename = f"{hashlib.sha256(data).hexdigest()}.{IMAGE_CACHE_EXTS.get(mime, 'png')}"
+    try:
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        path = os.path.join(IMAGE_CACHE_DIR, filename)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            _atomic_write(path, data)
+        if key:
+            # Replaces any earlier pointer; the file it named ages out via eviction
+            _atomic_write(os.path.join(IMAGE_CACHE_DIR, f'{key}.ref'), filename.encode())
+        _evict_image_cache()
+    except OSError as e:
+        print(f'image cache write error: {e}')
+        return None
+    return filename
+
+
+def generated_image_url(filename):
+    return f'/api/v1/generated/{filename}'
+
+
+def _evict_image_cache():
+    now = time.time()
+    entries = []
+    for entry in os.scandir(IMAGE_CACHE_DIR):
+        # Another worker may be evicting the same files concurrently
+        try:
+            if not entry.is_file() or entry.name.endswith('.tmp'):
+                continue
+            st = entry.stat()
+            if now - st.st_mtime > IMAGE_CACHE_TTL:
+                os.remove(entry.path)
+            elif not entry.name.endswith('.ref'):
+                # Pointers are a few bytes; they go by TTL or when found dangling
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        except FileNotFoundError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= IMAGE_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def vision_memo_get(ref_hash):
+    with _vision_memo_lock:
+        desc = _vision_memo.get(ref_hash)
+        if desc is not None:
+            _vision_memo.move_to_end(ref_hash)
+        return desc
+
+
+def vision_memo_put(ref_hash, desc):
+    with _vision_memo_lock:
+        _vision_memo[ref_hash] = desc
+        _vision_memo.move_to_end(ref_hash)
+        while len(_vision_memo) > VISION_MEMO_SIZE:
+            _vision_memo.popitem(last=False)
+
+
+# ─────────────────────────────────────────────────────────────
+# REFERENCE IMAGE PREPROCESSING
+# Uploads are decoded once, rotated per EXIF, downscaled to what the image
+# models actually use, and re-encoded without metadata. The same bytes then
+# go to both the vision and the generation call.
+# ─────────────────────────────────────────────────────────────
+REF_IMAGE_MAX_SIDE    = int(os.getenv('REF_IMAGE_MAX_SIDE', '1536'))
+REF_IMAGE_JPEG_QUALITY = 88
+
+
+def prepare_reference_image(data, mime):
+    """Returns (bytes, mime) ready for upload. Falls back to the original bytes
+    if Pillow is missing or the upload can't be decoded."""
+    if Image is None or not data:
+        return data, mime
+    try:
+        img = Image.open(io.BytesIO(data))
+        # JPEG can decode straight to a reduced scale, which is far cheaper
+        # than decoding a full phone photo and resizing afterwards.
+        img.draft('RGB', (REF_IMAGE_MAX_SIDE, REF_IMAGE_MAX_SIDE))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((REF_IMAGE_MAX_SIDE, REF_IMAGE_MAX_SIDE), Image.LANCZOS)
+        out = io.BytesIO()
+        if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+            img.convert('RGBA').save(out, 'WEBP', quality=90, method=4)
+            return out.getvalue(), 'image/webp'
+        img.convert('RGB').save(out, 'JPEG', quality=REF_IMAGE_JPEG_QUALITY, optimize=True)
+        return out.getvalue(), 'image/jpeg'
+    except Exception as e:   # Pillow raises a variety of errors on bad input
+        print(f'reference image preprocessing skipped: {e}')
+        return data, mime
+
+
+# ─────────────────────────────────────────────────────────────
+# IMAGE PROVIDER ORCHESTRATION
+# Providers can run one after another, hedged (the next one starts once the
+# current one is slower than IMAGE_HEDGE_DELAY or fails), or raced. The first
+# image wins and the losing HTTP calls are aborted by closing their sockets.
+# Per-provider latency / error stats reorder the Gemini models over time.
+# Every call spends someone's quota, so the default is sequential, and the
+# paid OpenAI fallback is never hedged or raced: it only runs once every
+# Gemini model has failed.
+# ─────────────────────────────────────────────────────────────
+IMAGE_PROVIDER_STRATEGY = os.getenv('IMAGE_PROVIDER_STRATEGY', 'sequential')  # sequential | hedged | race
+IMAGE_HEDGE_DELAY       = float(os.getenv('IMAGE_HEDGE_DELAY', '20'))         # seconds
+PROVIDER_MIN_SAMPLES    = 5     # calls per provider before its stats may reorder the list
+PROVIDER_STATS_ALPHA    = 0.2   # EWMA weight of the newest sample
+
+# Image-editing models — send the reference image when available so the
+# model treats the request as image-to-image, not text-to-image.
+# See https://ai.google.dev/gemini-api/docs/image-generation
+GEMINI_IMAGE_MODELS = [
+    'gemini-2.0-flash-preview-image-generation',  # primary image gen model
+    'gemini-2.0-flash-exp',                        # experimental fallback
+]
+
+_provider_stats = {}   # name -> {'calls', 'errors', 'latency', 'error_rate'} (EWMA)
+_provider_stats_lock = threading.Lock()
+
+
+class ProviderCancelled(Exception):
+    pass
+
+
+def record_provider_result(name, seconds, ok):
+    metric_observe('vpg_image_provider_seconds', seconds, provider=name, outcome='ok' if ok else 'error')
+    with _provider_stats_lock:
+        # The first outcome seeds both averages, so one early failure isn't diluted to 0.2
+        st = _provider_stats.setdefault(name, {'calls': 0, 'errors': 0, 'latency': seconds,
+                                               'error_rate': 0.0 if ok else 1.0})
+        st['calls'] += 1
+        st['errors'] += 0 if ok else 1
+        st['latency'] += PROVIDER_STATS_ALPHA * (seconds - st['latency'])
+        st['error_rate'] += PROVIDER_STATS_ALPHA * ((0.0 if ok else 1.0) - st['error_rate'])
+
+
+def provider_stats():
+    with _provider_stats_lock:
+        return {name: dict(st) for name, st in _provider_stats.items()}
+
+
+def order_providers(providers):
+    """Fastest-and-healthiest first, once every provider has enough samples."""
+    stats = provider_stats()
+    if any(stats.get(name, {}).get('calls', 0) < PROVIDER_MIN_SAMPLES for name, _ in providers):
+        return list(providers)
+    # A failing call usually costs its full latency and then some; weigh errors heavily
+    return sorted(providers, key=lambda p: stats[p[0]]['latency'] * (1 + 4 * stats[p[0]]['error_rate']))
+
+
+def _new_cancel_scope():
+    return {'event': threading.Event(), 'conns': set(), 'lock': threading.Lock()}
+
+
+def _cancel(scope):
+    with scope['lock']:
+        scope['event'].set()
+        for conn in list(scope['conns']):
+            try:
+                if conn.sock is not None:
+                    conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def post_json(url, payload, headers=None, timeout=60, cancel=None):
+    """POST JSON and decode the JSON reply. Raises urllib.error.HTTPError on 4xx/5xx,
+    ProviderCancelled if the scope was cancelled before or during the call."""
+    parts = urllib.parse.urlsplit(url)
+    conn_cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    conn = conn_cls(parts.netloc, timeout=timeout)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    if cancel:
+        with cancel['lock']:
+            if cancel['event'].is_set():
+                raise ProviderCancelled()
+            cancel['conns'].add(conn)
+    try:
+        conn.request('POST', path, body=json.dumps(payload).encode(),
+                     headers=dict({'Content-Type': 'application/json'}, **(headers or {})))
+        resp = conn.getresponse()
+        data = resp.read()
+        if resp.status >= 400:
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(data))
+        return json.loads(data.decode())
+    except (OSError, http.client.HTTPException):
+        if cancel and cancel['event'].is_set():
+            raise ProviderCancelled()
+        raise
+    finally:
+        if cancel:
+            with cancel['lock']:
+                cancel['conns'].discard(conn)
+        conn.close()
+
+
+def run_providers(providers, strategy=None, hedge_delay=None):
+    """providers: [(name, fn)], where fn(cancel_scope) returns a result dict or raises.
+    Returns (result or None, error_logs)."""
+    strategy = strategy or IMAGE_PROVIDER_STRATEGY
+    hedge = IMAGE_HEDGE_DELAY if hedge_delay is None else hedge_delay
+    pending = list(providers)
+    scope = _new_cancel_scope()
+    done = queue.Queue()
     error_logs = []
+    in_flight = {}   # name -> launch time, for providers still running
 
-    # ── STEP 1: Quick vision analysis to extract subject description ─────────────
-    # Only used as a fallback hint for OpenAI (which can’t see the image directly)
-    subject_desc = ""
-    if user_gemini_key and ref_b64:
+    def launch():
+        name, fn = pending.pop(0)
+        in_flight[name] = time.time()
+
+        def run():
+            started = time.time()
+            try:
+                done.put((name, fn(scope), None, time.time() - started))
+            except ProviderCancelled:
+                done.put((name, None, ProviderCancelled(), 0))
+            except Exception as e:
+                done.put((name, None, e, time.time() - started))
+        threading.Thread(target=run, name=f'provider-{name}', daemon=True).start()
+
+    running = 0
+    while pending and (running == 0 or strategy == 'race'):
+        launch()
+        running += 1
+
+    while running:
+        # Hedged: if nothing finishes within the delay, start the next provider too
+        wait = hedge if strategy == 'hedged' and pending else None
+        try:
+            name, result, error, seconds = done.get(timeout=wait)
+        except queue.Empty:
+            launch()
+            running += 1
+            continue
+        running -= 1
+        in_flight.pop(name, None)
+        if isinstance(error, ProviderCancelled):
+            continue
+        record_provider_result(name, seconds, ok=error is None)
+        if error is None:
+            # Losers are cut off, so their latency is censored: record what they
+            # had used so far (at least the winner's time) so a slow provider
+            # still collects samples and gets demoted by order_providers().
+            now = time.time()
+            for loser, started in in_flight.items():
+                record_provider_result(loser, max(now - started, seconds), ok=True)
+                metric_inc('vpg_image_provider_cancelled_total', provider=loser)
+            _cancel(scope)
+            return result, error_logs
+        error_logs.append(f'{name}: {error}')
+        if pending and strategy != 'race':
+            launch()
+            running += 1
+    return None, error_logs
+
+
+def _generate_image(user_gemini_key, prompt, ref_mime, ref_bytes, aspect_ratio, cache_key=None):
+    """Runs the provider pipeline. Returns (response_dict, http_status).
+    A successful image is stored in the generated-image cache under cache_key."""
+    error_logs = []
+
+    # Shrink the reference once and encode it once; both calls below share it
+    ref_bytes, ref_mime = prepare_reference_image(ref_bytes, ref_mime)
+    ref_b64 = base64.b64encode(ref_bytes).decode() if ref_bytes else ''
+
+    # ── STEP 1: Vision analysis to extract a subject description ─────────────────
+    # Only used as a hint for OpenAI (which can’t see the image directly), so it
+    # runs lazily inside the DALL-E provider instead of ahead of every request.
+    ref_hash = hashlib.sha256(ref_bytes).hexdigest() if ref_bytes else ''
+
+    def describe_subject(cancel):
+        desc = vision_memo_get(ref_hash)
+        if desc is not None or not user_gemini_key:
+            return desc or ''
         try:
             vurl = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={user_gemini_key}"
             vp = {
@@ -943,11 +2969,14 @@ def generate_image_api():
                     {"inlineData": {"mimeType": ref_mime, "data": ref_b64}}
                 ]}]
             }
-            vreq = urllib.request.Request(vurl, data=json.dumps(vp).encode(), headers={'Content-Type': 'application/json'}, method='POST')
-            with urllib.request.urlopen(vreq, timeout=20) as vr:
-                subject_desc = json.loads(vr.read().decode())['candidates'][0]['content']['parts'][0]['text']
+            desc = post_json(vurl, vp, timeout=20, cancel=cancel)['candidates'][0]['content']['parts'][0]['text']
+            vision_memo_put(ref_hash, desc)
+            return desc
+        except ProviderCancelled:
+            raise
         except Exception as e:
             error_logs.append(f"Vision: {e}")
+            return ''
 
     # ── Build the generation prompt ───────────────────────────────────────────
     if ref_b64:
@@ -960,34 +2989,34 @@ def generate_image_api():
             f"- Only change the scene, background, clothing, or context as described above.\n"
             f"- Output a high-quality, photorealistic image."
         )
-        # Fallback hint for OpenAI (which cannot see the image)
-        openai_prompt = (
-            f"A photorealistic portrait of a person ({subject_desc or 'as described below'}) "
-            f"in the following scene: {prompt}. High quality, cinematic."
-        )
+
+        def openai_prompt_for(cancel):
+            # Fallback hint for OpenAI (which cannot see the image)
+            subject_desc = describe_subject(cancel)
+            return (
+                f"A photorealistic portrait of a person ({subject_desc or 'as described below'}) "
+                f"in the following scene: {prompt}. High quality, cinematic."
+            )
     else:
         # TEXT-TO-IMAGE MODE
-        gen_prompt     = f"{prompt}\n\nStyle: high quality, cinematic, photorealistic."
-        openai_prompt  = gen_prompt
+        gen_prompt = f"{prompt}\n\nStyle: high quality, cinematic, photorealistic."
+
+        def openai_prompt_for(cancel):
+            return gen_prompt
+
+    gemini_providers = []
+    openai_providers = []
 
     # ── STEP 2: Gemini Image Generation (user's personal API key) ─────────────
     if user_gemini_key:
-        # Image-editing models — send the reference image when available so the
-        # model treats the request as image-to-image, not text-to-image.
-        # See https://ai.google.dev/gemini-api/docs/image-generation
-        GEMINI_IMAGE_MODELS = [
-            'gemini-2.0-flash-preview-image-generation',  # primary image gen model
-            'gemini-2.0-flash-exp',                        # experimental fallback
-        ]
-
         # Order matters: image first so Gemini treats it as an editing request
         content_parts = []
         if ref_b64:
             content_parts.append({"inlineData": {"mimeType": ref_mime, "data": ref_b64}})
         content_parts.append({"text": gen_prompt})
 
-        for model_name in GEMINI_IMAGE_MODELS:
-            try:
+        def gemini_call(model_name):
+            def call(cancel):
                 url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={user_gemini_key}"
                 payload = {
                     "contents": [{"parts": content_parts}],
@@ -996,9 +3025,10 @@ def generate_image_api():
                         "imageConfig": {"aspectRatio": aspect_ratio}
                     }
                 }
-                req = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'}, method='POST')
-                with urllib.request.urlopen(req, timeout=90) as resp:
-                    res_data = json.loads(resp.read().decode())
+                try:
+                    res_data = post_json(url, payload, timeout=90, cancel=cancel)
+                except urllib.error.HTTPError as he:
+                    raise RuntimeError(f"HTTP {he.code} — {he.read().decode()[:400]}")
 
                 if 'candidates' in res_data:
                     # Iterate in reverse — skip thought parts, grab the final image
@@ -1007,63 +3037,116 @@ def generate_image_api():
                         if part.get('thought'):
                             continue
                         if 'inlineData' in part:
-                            img_b64_enc = part['inlineData']['data']
                             mime = part['inlineData'].get('mimeType', 'image/png')
-                            return jsonify({'status': 'success', 'image_b64': f"data:{mime};base64,{img_b64_enc}", 'mime_type': mime})
+                            return {'image_bytes': base64.b64decode(part['inlineData']['data']), 'mime_type': mime}
+                raise RuntimeError("returned no image part.")
+            return call
 
-                error_logs.append(f"Gemini/{model_name}: returned no image part.")
-            except urllib.error.HTTPError as he:
-                err_body = he.read().decode()[:400]
-                error_logs.append(f"Gemini/{model_name}: HTTP {he.code} — {err_body}")
-            except Exception as ex:
-                error_logs.append(f"Gemini/{model_name}: {str(ex)}")
+        gemini_providers = [(f'Gemini/{m}', gemini_call(m)) for m in GEMINI_IMAGE_MODELS]
 
     # ── STEP 3: OpenAI DALL-E 3 Fallback ────────────────────────────────────
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
     if OPENAI_API_KEY:
-        try:
-            url = "https://api.openai.com/v1/images/generations"
+        def openai_call(cancel):
             payload = {
                 "model": "dall-e-3",
-                "prompt": openai_prompt[:1000],
+                "prompt": openai_prompt_for(cancel)[:1000],
                 "n": 1,
                 "size": "1024x1024",
                 "response_format": "b64_json"
             }
-            req = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={
-                'Authorization': f'Bearer {OPENAI_API_KEY}',
-                'Content-Type': 'application/json'
-            }, method='POST')
-            with urllib.request.urlopen(req, timeout=60) as resp:
-                res_data = json.loads(resp.read().decode())
-                if 'data' in res_data and len(res_data['data']) > 0:
-                    img_b64_enc = res_data['data'][0]['b64_json']
-                    return jsonify({'status': 'success', 'image_b64': f"data:image/png;base64,{img_b64_enc}", 'mime_type': 'image/png'})
-                error_logs.append("OpenAI returned no image data.")
-        except urllib.error.HTTPError as he:
-            error_logs.append(f"OpenAI/DALL-E 3: HTTP {he.code} — {he.read().decode()[:200]}")
-        except Exception as ex:
-            error_logs.append(f"OpenAI/DALL-E 3: {str(ex)}")
+            try:
+                res_data = post_json("https://api.openai.com/v1/images/generations", payload,
+                                     headers={'Authorization': f'Bearer {OPENAI_API_KEY}'},
+                                     timeout=60, cancel=cancel)
+            except urllib.error.HTTPError as he:
+                raise RuntimeError(f"HTTP {he.code} — {he.read().decode()[:200]}")
+            if 'data' in res_data and len(res_data['data']) > 0:
+                return {'image_bytes': base64.b64decode(res_data['data'][0]['b64_json']), 'mime_type': 'image/png'}
+            raise RuntimeError("returned no image data.")
 
-    if not user_gemini_key and not OPENAI_API_KEY:
-        return jsonify({'status': 'error', 'message': 'No API keys configured for your account.'}), 500
+        openai_providers = [('OpenAI/DALL-E 3', openai_call)]
 
-    error_summary = " | ".join(error_logs)
-    return jsonify({'status': 'error', 'message': f'Image generation failed. Details: {error_summary}'}), 500
+    if not user_gemini_key and not OPENAI_API_KEY:
+        return {'status': 'error', 'message': 'No API keys configured for your account.'}, 500
+
+    # DALL-E can't see the reference image and is billed to us, so it only
+    # runs, on its own, after every Gemini model has failed
+    result, provider_errors = run_providers(order_providers(gemini_providers))
+    if not result and openai_providers:
+        result, openai_errors = run_providers(openai_providers, strategy='sequential')
+        provider_errors += openai_errors
+    if result:
+        # Store the decoded bytes once and hand back a URL; the job result stays
+        # a few hundred bytes instead of a multi-megabyte data: URL.
+        data, mime = result['image_bytes'], result['mime_type']
+        filename = image_cache_put(cache_key, data, mime)
+        if filename:
+            return {'status': 'success', 'image_url': generated_image_url(filename), 'mime_type': mime}, 200
+        return {'status': 'success', 'mime_type': mime,
+                'image_b64': f"data:{mime};base64,{base64.b64encode(data).decode()}"}, 200
+
+    error_summary = " | ".join(error_logs + provider_errors)
+    return {'status': 'error', 'message': f'Image generation failed. Details: {error_summary}'}, 500
 
 
 # ─────────────────────────────────────────────────────────────
 # STATIC / SEO helpers
 # ─────────────────────────────────────────────────────────────
+# Fingerprinted, minified and precompressed copies of app.js / style.css are
+# built into static/dist by build_assets.py (run at startup when the sources
+# changed). Templates link them via {{ asset_url(...) }}; their names change
+# with their content, so they're cached forever. ASSET_PIPELINE=0 serves the
+# raw sources instead, which is handier while editing them.
+ASSET_PIPELINE = os.getenv('ASSET_PIPELINE', '1') != '0'
+_HASHED_ASSET_RE = re.compile(r'^dist/[\w-]+\.[0-9a-f]{12}\.(js|css)$')
+
+
+def _load_asset_manifest():
+    if not ASSET_PIPELINE:
+        return {}
+    manifest = build_assets.load_manifest()
+    try:
+        if not build_assets.manifest_is_current(manifest):
+            manifest = build_assets.build_assets(verbose=False)
+    except OSError as e:
+        print(f'asset build error, serving raw assets: {e}')
+    return manifest
+
+
+_asset_manifest = _load_asset_manifest()
+
+
+def asset_url(rel_path):
+    entry = _asset_manifest.get(rel_path)
+    return f'/static/{entry["file"]}' if entry else f'/static/{rel_path}'
+
+
+@app.context_processor
+def inject_asset_url():
+    return {'asset_url': asset_url}
+
+
 @app.route('/static/<path:path>')
 def send_static(path):
-    return send_from_directory('static', path)
+    if not _HASHED_ASSET_RE.match(path):
+        return send_from_directory('static', path)
+    mimetype = mimetypes.guess_type(path)[0]
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in request.accept_encodings and os.path.exists(os.path.join(app.root_path, 'static', path + suffix)):
+            response = send_from_directory('static', path + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory('static', path, mimetype=mimetype)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 @app.route('/ads.txt')
 def ads_txt():
     # ads.txt must be served from the ROOT of the domain, not /static/
     # Use absolute path to guarantee it works regardless of working directory
-    from flask import Response
     ads_content = "google.com, pub-5050768956635718, DIRECT, f08c47fec0942fa0\n"
     return Response(ads_content, mimetype='text/plain', headers={
         'Cache-Control': 'public, max-age=86400',
@@ -1074,46 +3157,126 @@ def ads_txt():
 def robots_txt():
     return send_from_directory(app.root_path, 'robots.txt')
 
-@app.route('/sitemap.xml')
-def sitemap_xml():
-    from flask import Response
-    from datetime import datetime
-    # Get current prompts for dynamic sitemap entries
+# Sitemaps are rebuilt only when the prompt snapshot changes (generation) and
+# kept as ready-to-send bytes, plain and gzipped. Past SITEMAP_SHARD_SIZE URLs
+# /sitemap.xml becomes an index over /sitemap-<n>.xml shards (limit is 50k).
+SITEMAP_BASE       = 'https://video-prompts-gallery.onrender.com'
+SITEMAP_SHARD_SIZE = 45000
+SITEMAP_PAGES = [   # (path, changefreq, priority)
+    ('/',                                        'daily',   '1.0'),
+    ('/about',                                   'monthly', '0.8'),
+    ('/contact',                                 'monthly', '0.7'),
+    ('/blog',                                    'weekly',  '0.9'),
+    ('/blog/how-to-write-ai-video-prompts',      'monthly', '0.85'),
+    ('/blog/runway-ml-vs-pika-labs',             'monthly', '0.8'),
+    ('/blog/cinematic-lighting-prompts',         'monthly', '0.8'),
+    ('/blog/ai-video-prompts-for-social-media',  'monthly', '0.8'),
+    ('/blog/nature-landscape-prompts',           'monthly', '0.8'),
+    ('/blog/scifi-cinematic-prompts',            'monthly', '0.8'),
+]
+_sitemaps = {'current': None}
+_sitemaps_lock = threading.Lock()
+
+
+def _sitemap_date(timestamp):
+    """'YYYY-MM-DD' from a sheet Timestamp ('YYYY-MM-DD HH:MM:SS'), or None."""
     try:
-        data = fetch_data()
-        prompts = data.get('prompts', []) or []
-    except Exception:
-        prompts = []
-    
-    BASE = 'https://video-prompts-gallery.onrender.com'
-    TODAY = datetime.now().strftime('%Y-%m-%d')
-    
-    urls = [
-        f'<url><loc>{BASE}/</loc><changefreq>daily</changefreq><priority>1.0</priority><lastmod>{TODAY}</lastmod></url>',
-        f'<url><loc>{BASE}/about</loc><changefreq>monthly</changefreq><priority>0.8</priority><lastmod>{TODAY}</lastmod></url>',
-        f'<url><loc>{BASE}/contact</loc><changefreq>monthly</changefreq><priority>0.7</priority><lastmod>{TODAY}</lastmod></url>',
-        f'<url><loc>{BASE}/blog</loc><changefreq>weekly</changefreq><priority>0.9</priority><lastmod>{TODAY}</lastmod></url>',
-        f'<url><loc>{BASE}/blog/how-to-write-ai-video-prompts</loc><changefreq>monthly</changefreq><priority>0.85</priority><lastmod>{TODAY}</lastmod></url>',
-        f'<url><loc>{BASE}/blog/runway-ml-vs-pika-labs</loc><changefreq>monthly</changefreq><priority>0.8</priority><lastmod>{TODAY}</lastmod></url>',
-        f'<url><loc>{BASE}/blog/cinematic-lighting-prompts</loc><changefreq>monthly</changefreq><priority>0.8</priority><lastmod>{TODAY}</lastmod></url>',
-        f'<url><loc>{BASE}/blog/ai-video-prompts-for-social-media</loc><changefreq>monthly</changefreq><priority>0.8</priority><lastmod>{TODAY}</lastmod></url>',
-        f'<url><loc>{BASE}/blog/nature-landscape-prompts</loc><changefreq>monthly</changefreq><priority>0.8</priority><lastmod>{TODAY}</lastmod></url>',
-        f'<url><loc>{BASE}/blog/scifi-cinematic-prompts</loc><changefreq>monthly</changefreq><priority>0.8</priority><lastmod>{TODAY}</lastmod></url>',
-    ]
-    
-    # Add individual prompt deep-link URLs for SEO
+        return datetime.strptime(str(timestamp).strip()[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def _sitemap_url(loc, changefreq, priority, lastmod=None):
+    lastmod_tag = f'<lastmod>{lastmod}</lastmod>' if lastmod else ''
+    return (f'<url><loc>{xml_escape(loc)}</loc>{lastmod_tag}'
+            f'<changefreq>{changefreq}</changefreq><priority>{priority}</priority></url>')
+
+
+def _sitemap_file(body):
+    data = f'<?xml version="1.0" encoding="UTF-8"?>\n{body}'.encode('utf-8')
+    return {'xml': data, 'gz': gzip.compress(data, compresslevel=9),
+            'etag': hashlib.sha256(data).hexdigest()[:32]}
+
+
+def _build_sitemaps(prompts):
+    """{name: file} for 'sitemap.xml' and, when sharded, 'sitemap-<n>.xml'."""
+    entries = []   # (url xml, lastmod)
     for p in prompts:
-        pid = p.get('Unique ID', '')
+        pid = str(p.get('Unique ID', '')).strip()
         if pid:
-            urls.append(f'<url><loc>{BASE}/?prompt_id={pid}</loc><changefreq>monthly</changefreq><priority>0.7</priority><lastmod>{TODAY}</lastmod></url>')
-
-    sitemap_body = '\n'.join(urls)
-    sitemap = f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n{sitemap_body}\n</urlset>'
-    
-    return Response(sitemap, mimetype='application/xml', headers={
-        'Cache-Control': 'public, max-age=3600'
+            lastmod = _sitemap_date(p.get('Timestamp', ''))
+            entries.append((_sitemap_url(f'{SITEMAP_BASE}/prompt/{quote(pid)}', 'monthly', '0.7', lastmod), lastmod))
+    newest = max((m for _, m in entries if m), default=None)
+    # Only the home page changes when prompts do; other pages carry no lastmod
+    # rather than a made-up one.
+    pages = []
+    for path, freq, prio in SITEMAP_PAGES:
+        lastmod = newest if path == '/' else None
+        pages.append((_sitemap_url(f'{SITEMAP_BASE}{path}', freq, prio, lastmod), lastmod))
+    entries = pages + entries
+
+    urlset = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n{}\n</urlset>'
+    if len(entries) <= SITEMAP_SHARD_SIZE:
+        return {'sitemap.xml': _sitemap_file(urlset.format('\n'.join(u for u, _ in entries)))}
+
+    files, index = {}, []
+    for n, start in enumerate(range(0, len(entries), SITEMAP_SHARD_SIZE), start=1):
+        shard = entries[start:start + SITEMAP_SHARD_SIZE]
+        files[f'sitemap-{n}.xml'] = _sitemap_file(urlset.format('\n'.join(u for u, _ in shard)))
+        lastmod = max((m for _, m in shard if m), default=None)
+        lastmod_tag = f'<lastmod>{lastmod}</lastmod>' if lastmod else ''
+        index.append(f'<sitemap><loc>{SITEMAP_BASE}/sitemap-{n}.xml</loc>{lastmod_tag}</sitemap>')
+    files['sitemap.xml'] = _sitemap_file(
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n{}\n</sitemapindex>'.format('\n'.join(index)))
+    return files
+
+
+def _sitemap_files():
+    try:
+        fetch_data()
+    except Exception:
+        pass
+    current = _sitemaps['current']
+    if current and current['generation'] == cache['generation']:
+        return current['files']
+    with _sitemaps_lock:
+        current = _sitemaps['current']
+        generation = cache['generation']
+        if not current or current['generation'] != generation:
+            current = {'generation': generation, 'files': _build_sitemaps(cache['prompts'] or [])}
+            _sitemaps['current'] = current
+    return current['files']
+
+
+def _send_sitemap(name):
+    f = _sitemap_files().get(name)
+    if f is None:
+        return 'Not found', 404
+    if 'gzip' in request.accept_encodings:
+        body, encoding, tag = f['gz'], 'gzip', f'{f["etag"]}-gz'
+    else:
+        body, encoding, tag = f['xml'], None, f['etag']
+    headers = {
+        'Cache-Control': 'public, max-age=3600',
+        'Vary': 'Accept-Encoding',
+        'ETag': f'"{tag}"',
         # Removed X-Robots-Tag: noindex as it can cause "Couldn't fetch" in Search Console
-    })
+    }
+    if any(request.if_none_match.contains_weak(t) for t in (f['etag'], f'{f["etag"]}-gz')):
+        return Response(status=304, headers=headers)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype='application/xml', headers=headers)
+
+
+@app.route('/sitemap.xml')
+def sitemap_xml():
+    return _send_sitemap('sitemap.xml')
+
+
+@app.route('/sitemap-<int:n>.xml')
+def sitemap_shard(n):
+    return _send_sitemap(f'sitemap-{n}.xml')
 
 
 
@@ -1136,6 +3299,16 @@ def google_verification():
 @app.route('/healthz')
 def healthz():   return 'OK', 200
 
+@app.route('/api/v1/cache-status')
+def cache_status():
+    """Snapshot freshness for monitoring — age in seconds and rebuild generation."""
+    age = cache_age()
+    return jsonify({
+        'generation':  cache['generation'],
+        'age_seconds': round(age, 1) if age is not None else None,
+        'refreshing':  _refresh_state['in_flight'],
+    })
+
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 9000))
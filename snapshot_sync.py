@@ -0,0 +1,102 @@
+"""Incremental client for the /api/v1/export NDJSON stream, shared by the
+static builders.
+
+Each line is applied to a small SQLite file as it arrives, so after the first
+run only changed items cross the wire and memory stays flat however large
+the stream gets. The store is committed only once the stream's "end" line
+has arrived; a broken download leaves the previous state untouched.
+load_payload() turns the stored items back into the {prompts, counts, images}
+shape the site expects.
+"""
+import os
+import json
+import sqlite3
+import urllib.parse
+import urllib.request
+
+EXPORT_PATH = '/api/v1/export'
+DEFAULT_SECTIONS = ('prompts', 'counts', 'images')
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE IF NOT EXISTS items (key TEXT PRIMARY KEY, seq INTEGER, line TEXT)')
+    conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+    return conn
+
+
+def stored_cursor(db_path):
+    """Cursor of the last completed sync, or '' if there is none."""
+    if not os.path.exists(db_path):
+        return ''
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE name = 'cursor'").fetchone()
+        return row[0] if row else ''
+    finally:
+        conn.close()
+
+
+def sync(api_url, db_path, sections=DEFAULT_SECTIONS, timeout=30):
+    """Bring db_path up to date with the server. Returns (cursor, items applied)."""
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE name = 'cursor'").fetchone()
+        query = {'sections': ','.join(sections)}
+        if row:
+            query['since'] = row[0]
+        # New items go after everything stored; updated ones keep their place
+        seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM items').fetchone()[0]
+        applied, end = 0, None
+        url = f"{api_url}{EXPORT_PATH}?{urllib.parse.urlencode(query)}"
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            for raw in response:
+                if not raw.strip():
+                    continue
+                item = json.loads(raw)
+                kind = item.get('type')
+                if kind == 'meta':
+                    if item.get('full'):
+                        conn.execute('DELETE FROM items')
+                        seq = 0
+                elif kind == 'end':
+                    end = item
+                    break
+                elif item.get('deleted'):
+                    conn.execute('DELETE FROM items WHERE key = ?', (f"{kind}:{item['id']}",))
+                    applied += 1
+                else:
+                    seq += 1
+                    conn.execute('INSERT INTO items (key, seq, line) VALUES (?, ?, ?) '
+                                 'ON CONFLICT(key) DO UPDATE SET line = excluded.line',
+                                 (f"{kind}:{item['id']}", seq, raw.decode('utf-8').strip()))
+                    applied += 1
+        if end is None:
+            raise ValueError('export stream ended before its "end" line')
+        conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('cursor', ?)", (end['cursor'],))
+        conn.commit()
+        return end['cursor'], applied
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def load_payload(db_path):
+    """The stored items as {prompts, counts, images}, prompts in sheet order."""
+    prompts, counts, images = [], {}, {}
+    conn = _connect(db_path)
+    try:
+        for (line,) in conn.execute('SELECT line FROM items ORDER BY seq'):
+            item = json.loads(line)
+            kind = item['type']
+            if kind == 'prompt':
+                prompts.append(item['data'])
+            elif kind == 'count':
+                counts[item['id']] = {'likes': item.get('likes', 0), 'comments': item.get('comments', 0)}
+            elif kind == 'image':
+                images[item['id']] = item['data']
+    finally:
+        conn.close()
+    return {'prompts': prompts, 'counts': counts, 'images': images}
@@ -5,8 +5,8 @@
 // ─────────────────────────────────────────────────────────────
 let appState = {
     prompts: [],
-    analytics: [],
-    comments: [],
+    counts: {},   // { promptId: { likes, comments } } — aggregated server-side
+    images: {},   // { promptId: { avif, webp, placeholder } } — responsive renditions
     activeCategory: 'all',
     searchQuery: '',
     currentPage: 1,
@@ -245,8 +245,8 @@ async function fetchData() {
         const response = await fetch(API_BASE + '/api/v1/prompts');
         const data = await response.json();
         appState.prompts = data.prompts || [];
-        appState.analytics = data.analytics || [];
-        appState.comments = data.comments || [];
+        appState.counts = data.counts || {};
+        appState.images = data.images || {};
 
         renderFilters();
         renderGrid();
@@ -397,6 +397,9 @@ function makeAdCard() {
     return div;
 }
 
+// Matches the .prompt-grid column counts (2 / 3 / 4) in style.css
+const CARD_IMAGE_SIZES = '(min-width: 1024px) 25vw, (min-width: 768px) 33vw, 50vw';
+
 function makePromptCard(prompt) {
     const id = prompt[F_ID] || '';
     const title = prompt[F_TITLE] || 'Untitled';
@@ -407,15 +410,23 @@ function makePromptCard(prompt) {
     card.dataset.promptId = id;
 
     if (imageUrl) {
+        const renditions = appState.images[id];
         const img = document.createElement('img');
         img.src = imageUrl;
         img.className = 'vpg-card-img';
         img.alt = title;
         img.loading = 'lazy';
-        img.style.opacity = '0';
         img.style.transition = 'opacity 0.4s ease-in-out';
+        if (renditions && renditions.placeholder) {
+            // Blurred 32px preview shows through until the real image decodes
+            img.style.backgroundImage = `url("${renditions.placeholder}")`;
+            img.style.backgroundSize = 'cover';
+        } else {
+            img.style.opacity = '0';
+        }
         img.onload = () => {
             img.style.opacity = '1';
+            img.style.backgroundImage = '';
             card.style.animation = 'none';
         };
         img.onerror = () => {
@@ -424,7 +435,22 @@ function makePromptCard(prompt) {
             card.prepend(errorFallback);
             card.style.animation = 'none';
         };
-        card.appendChild(img);
+        if (renditions) {
+            // Let the browser pick the smallest AVIF/WebP that fills the grid column
+            const picture = document.createElement('picture');
+            for (const type of ['avif', 'webp']) {
+                if (!renditions[type]) continue;
+                const source = document.createElement('source');
+                source.type = `image/${type}`;
+                source.srcset = renditions[type];
+                source.sizes = CARD_IMAGE_SIZES;
+                picture.appendChild(source);
+            }
+            picture.appendChild(img);
+            card.appendChild(picture);
+        } else {
+            card.appendChild(img);
+        }
 
         const overlay = document.createElement('div');
         overlay.className = 'vpg-card-overlay';
@@ -495,9 +521,7 @@ function showDetail(id) {
     const category = prompt[F_CATEGORY] || 'General';
     const text = prompt[F_PROMPT] || '';
     const imageUrl = prompt['Image URL'] || '';
-    const likes = (appState.analytics || []).filter(
-        a => a['Prompt ID'] == id && a['Event Type'] === 'like'
-    ).length;
+    const likes = likeCount(id);
 
     const modal = document.getElementById('vpg-modal');
     const body = document.getElementById('modal-body');
@@ -647,8 +671,8 @@ function showDetail(id) {
     const fab = document.getElementById('vpg-fab-install');
     if (fab) fab.style.display = 'none';
 
-    // Self-referencing canonical for deep links
-    _setCanonical(`https://video-prompts-gallery.onrender.com/?prompt_id=${id}`);
+    // Same canonical as the server-rendered page and the sitemap
+    _setCanonical(`https://video-prompts-gallery.onrender.com/prompt/${encodeURIComponent(id)}`);
 
     logVisit(id);
 }
@@ -754,6 +778,11 @@ function closeMobileNav() {
 // ─────────────────────────────────────────────────────────────
 // 7. ACTIONS (Like, Copy, Share)
 // ─────────────────────────────────────────────────────────────
+function likeCount(id) {
+    const c = appState.counts[id];
+    return c ? (c.likes || 0) : 0;
+}
+
 async function handleLike(id, btn) {
     if (!btn || btn.disabled) return;
     btn.disabled = true;
@@ -768,15 +797,13 @@ async function handleLike(id, btn) {
 
         if (res.ok) {
             btn.textContent = '♥ Liked!';
-            // Update local analytics state so count reflects immediately
-            appState.analytics.push({ 'Prompt ID': id, 'Event Type': 'like' });
+            // Update local counts so the number reflects immediately
+            const c = appState.counts[id] || (appState.counts[id] = { likes: 0, comments: 0 });
+            c.likes += 1;
             // Update card like button count if visible
             const cardBtn = document.getElementById(`like-btn-${id}`);
             if (cardBtn) {
-                const n = (appState.analytics || []).filter(
-                    a => a['Prompt ID'] == id && a['Event Type'] === 'like'
-                ).length;
-                cardBtn.textContent = `♥ Like (${n})`;
+                cardBtn.textContent = `♥ Like (${c.likes})`;
             }
         } else {
             btn.disabled = false;
@@ -845,7 +872,9 @@ function sharePrompt(id) {
     // Attempt to detect the parent page URL (Google Sites page) via document.referrer
     // If not available or irrelevant, fall back to API_BASE or current location.
     let base = window.SHARE_BASE_URL;
-    
+    // On the Flask server, /prompt/<id> is rendered server-side for fast deep links
+    let serverPage = false;
+
     if (!base) {
         const referrer = document.referrer;
         if (referrer && (referrer.includes('sites.google.com') || referrer.includes('googleusercontent.com'))) {
@@ -856,6 +885,7 @@ function sharePrompt(id) {
             // Avoid hardcoding onrender unless we are literally on onrender
             if (location.hostname.includes('onrender.com')) {
                 base = 'https://video-prompts-gallery.onrender.com/';
+                serverPage = true;
             } else {
                 // This covers Vercel, Netlify, Custom Domains, or direct file access
                 base = location.origin !== 'null' ? (location.origin + location.pathname) : 'https://sites.google.com/'; 
@@ -863,7 +893,9 @@ function sharePrompt(id) {
         }
     }
     
-    const url = `${base.replace(/\/$/, '')}/?prompt_id=${encodeURIComponent(id)}`;
+    const url = serverPage
+        ? `${base.replace(/\/$/, '')}/prompt/${encodeURIComponent(id)}`
+        : `${base.replace(/\/$/, '')}/?prompt_id=${encodeURIComponent(id)}`;
     
     if (navigator.clipboard && navigator.clipboard.writeText) {
         navigator.clipboard.writeText(url).then(() => {
@@ -1430,11 +1462,12 @@ async function savePrompt() {
 // Force a fresh data pull (busts cache)
 async function refreshData() {
     try {
-        const response = await fetch(API_BASE + '/api/v1/prompts?_=' + Date.now());
+        // Revalidate with the server's ETag instead of cache-busting the URL
+        const response = await fetch(API_BASE + '/api/v1/prompts', { cache: 'no-cache' });
         const data = await response.json();
         appState.prompts = data.prompts || [];
-        appState.analytics = data.analytics || [];
-        appState.comments = data.comments || [];
+        appState.counts = data.counts || {};
+        appState.images = data.images || {};
         renderFilters();
         renderGrid();
     } catch (e) {
@@ -1742,7 +1775,7 @@ const imgGenState = {
     selectedListPrompt: '',
     referenceImageB64: '',
     referenceImageMime: '',
-    generatedImageB64: '',
+    generatedImageUrl: '',
     generatedMime: 'image/png',
     retriesLeft: 3,
     isGenerating: false,
@@ -2026,9 +2059,32 @@ async function imggenRetry() {
 }
 
 // ── API call ──────────────────────────────────────────────────
+// Generation runs as a server-side job: submit, then poll until it finishes.
+const IMGGEN_POLL_MS = 2000;
+const IMGGEN_POLL_LIMIT_MS = 5 * 60 * 1000;
+
+async function _imgGenWaitForJob(jobId) {
+    const started = Date.now();
+    let delay = IMGGEN_POLL_MS;
+    while (Date.now() - started < IMGGEN_POLL_LIMIT_MS) {
+        await new Promise(r => setTimeout(r, delay));
+        const res = await fetch(`${API_BASE}/api/v1/generate-image/${encodeURIComponent(jobId)}`);
+        if (res.status === 429) {
+            // Rate limited: the job is still running, so back off and keep polling
+            const retryAfter = Number(res.headers.get('Retry-After')) * 1000;
+            delay = Math.min(Math.max(retryAfter || 0, delay * 2), 30000);
+            continue;
+        }
+        delay = IMGGEN_POLL_MS;
+        const data = await res.json();
+        if (res.status !== 202) return { res, data };
+    }
+    return { res: { ok: false, status: 504 }, data: { message: 'Image generation timed out. Please try again.' } };
+}
+
 async function _imgGenCallAPI(promptText) {
     try {
-        const res = await fetch(API_BASE + '/api/v1/generate-image', {
+        let res = await fetch(API_BASE + '/api/v1/generate-image', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
@@ -2038,11 +2094,19 @@ async function _imgGenCallAPI(promptText) {
                 aspect_ratio: imgGenState.aspectRatio || '1:1',
             }),
         });
-        const data = await res.json();
+        let data = await res.json();
+        if (res.status === 202 && data.job_id) {
+            ({ res, data } = await _imgGenWaitForJob(data.job_id));
+        }
         if (res.ok && data.status === 'success') {
-            imgGenState.generatedImageB64 = data.image_b64;
+            // Images come back as a URL to the binary file; a data: URL is only
+            // sent if the server couldn't store the image.
+            const src = data.image_url
+                ? (data.image_url.startsWith('/') ? API_BASE + data.image_url : data.image_url)
+                : data.image_b64;
+            imgGenState.generatedImageUrl = src;
             imgGenState.generatedMime = data.mime_type || 'image/png';
-            _imgGenShowResult(data.image_b64);
+            _imgGenShowResult(src);
         } else if (res.status === 401 && data.message === 'LOGIN_REQUIRED') {
             // Session expired — prompt re-login
             authState.loggedIn = false;
@@ -2067,14 +2131,25 @@ async function _imgGenCallAPI(promptText) {
 }
 
 // ── Download ──────────────────────────────────────────────────
-function imggenDownload() {
-    const src = imgGenState.generatedImageB64;
+async function imggenDownload() {
+    const src = imgGenState.generatedImageUrl;
     if (!src) return;
     const ext = (imgGenState.generatedMime || 'image/png').split('/')[1] || 'png';
+    // The download attribute is ignored for cross-origin links (Google Sites
+    // embed), so fetch the bytes and save them from a same-origin blob URL.
+    let href = src;
+    if (!src.startsWith('data:')) {
+        try {
+            href = URL.createObjectURL(await (await fetch(src)).blob());
+        } catch (err) {
+            href = src;
+        }
+    }
     const link = document.createElement('a');
-    link.href = src;
+    link.href = href;
     link.download = `vpg-ai-${Date.now()}.${ext}`;
     link.click();
+    if (href.startsWith('blob:')) setTimeout(() => URL.revokeObjectURL(href), 10000);
 }
 
 // ── Minimize / Close result panel ────────────────────────────
@@ -2097,7 +2172,7 @@ function imggenCloseResult() {
     }
     const btn = document.getElementById('imggen-minimize-btn');
     if (btn) btn.textContent = '\u25b2 Minimize';
-    imgGenState.generatedImageB64 = '';
+    imgGenState.generatedImageUrl = '';
     imgGenState.generatedMime = 'image/png';
 }
 
@@ -2111,10 +2186,10 @@ function _imgGenSetLoading(loading, label) {
     if (lbl) lbl.textContent = loading ? label : 'Generate Image';
 }
 
-function _imgGenShowResult(dataUrl) {
+function _imgGenShowResult(src) {
     const result = document.getElementById('imggen-result');
     const img = document.getElementById('imggen-result-img');
-    if (img) img.src = dataUrl;
+    if (img) img.src = src;
     if (result) {
         result.classList.remove('hidden');
         result.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
@@ -1,27 +1,87 @@
-const CACHE_NAME = 'vpg-cache-v1';
-const urlsToCache = [
-  '/',
-  '/static/css/style.css',
-  '/static/js/app.js',
-  '/static/favicon.png'
-];
+// Bump when the caching strategy changes; old caches are deleted on activate.
+const CACHE_NAME = 'vpg-cache-v3';
+const ASSET_MANIFEST = '/static/dist/manifest.json';
+// Fingerprinted bundle: /static/dist/<stem>.<hash>.<ext>
+const BUNDLE_RE = /\/static\/dist\/([\w-]+)\.[0-9a-f]{12}\.(js|css)$/;
+
+// Bundles the current build references, per the asset manifest ([] without one)
+function currentBundles() {
+  return fetch(ASSET_MANIFEST, { cache: 'no-store' })
+    .then(response => response.ok ? response.json() : {})
+    .then(manifest => Object.values(manifest).map(entry => `/static/${entry.file}`))
+    .catch(() => []);
+}
+
+// Drop cached bundles for which keep(url, stem) is false
+function pruneBundles(cache, keep) {
+  return cache.keys().then(requests => Promise.all(requests
+    .filter(request => {
+      const match = request.url.match(BUNDLE_RE);
+      return match && !keep(new URL(request.url).pathname, `${match[1]}.${match[2]}`);
+    })
+    .map(request => cache.delete(request))));
+}
 
 self.addEventListener('install', event => {
   event.waitUntil(
     caches.open(CACHE_NAME)
-      .then(cache => {
-        return cache.addAll(urlsToCache);
-      })
+      .then(cache => currentBundles().then(bundles => cache.addAll(['/static/favicon.png', ...bundles])))
+  );
+  self.skipWaiting();
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(names => Promise.all(names.filter(name => name !== CACHE_NAME).map(name => caches.delete(name))))
+      .then(() => Promise.all([caches.open(CACHE_NAME), currentBundles()]))
+      .then(([cache, bundles]) => bundles.length && pruneBundles(cache, url => bundles.includes(url)))
+      .then(() => self.clients.claim())
   );
 });
 
-// A simple pass-through fetch handler that falls back to network
 self.addEventListener('fetch', event => {
   // Only intercept GET requests
   if (event.request.method !== 'GET') return;
   // Ignore API calls so they remain fresh
   if (event.request.url.includes('/api/')) return;
 
+  // Pages: network first, so HTML always references the asset fingerprints
+  // that currently exist; the cached copy is only an offline fallback.
+  if (event.request.mode === 'navigate') {
+    event.respondWith(
+      fetch(event.request)
+        .then(response => {
+          if (response.ok) {
+            const copy = response.clone();
+            caches.open(CACHE_NAME).then(cache => cache.put(event.request, copy));
+          }
+          return response;
+        })
+        .catch(() => caches.match(event.request))
+    );
+    return;
+  }
+
+  // Bundles never change under a given name, so they are cache-first. Caching
+  // a new build's bundle evicts the older builds of the same file.
+  const bundle = event.request.url.match(BUNDLE_RE);
+  if (bundle) {
+    const path = new URL(event.request.url).pathname;
+    event.respondWith(
+      caches.open(CACHE_NAME).then(cache => cache.match(event.request).then(cached => cached ||
+        fetch(event.request).then(response => {
+          if (response.ok) {
+            const copy = response.clone();
+            cache.put(event.request, copy)
+              .then(() => pruneBundles(cache, (url, stem) => url === path || stem !== `${bundle[1]}.${bundle[2]}`));
+          }
+          return response;
+        })))
+    );
+    return;
+  }
+
   event.respondWith(
     caches.match(event.request)
       .then(response => {